@@ -0,0 +1,131 @@
+"""Admission control in front of the LLM: bounded in-flight runs, a fair wait queue and query coalescing"""
+import asyncio
+import collections
+import math
+import time
+from contextlib import asynccontextmanager
+
+from metrics import registry
+
+queue_depth = registry.gauge("admission_queue_depth", "Requests waiting for an LLM slot")
+in_flight = registry.gauge("admission_in_flight", "Agent runs currently holding an LLM slot")
+wait_seconds = registry.histogram("admission_wait_seconds", "Time spent waiting for an LLM slot")
+rejected = registry.counter("admission_rejected_total", "Requests turned away by admission control, by reason")
+coalesced = registry.counter("admission_coalesced_total", "Requests answered by an identical in-flight query")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot get an LLM slot; carries the HTTP status and a Retry-After hint"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Lets at most `max_in_flight` agent runs reach the model at once.
+
+    Further requests wait in FIFO order, at most `max_queue` of them and for
+    at most `max_wait` seconds. A full queue is rejected at once with 429, a
+    request that waited too long with 503; both carry a Retry-After estimate
+    from the recent slot hold time. Must be used from a single event loop.
+    """
+
+    def __init__(self, max_in_flight=2, max_queue=16, max_wait=30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._in_flight = 0
+        self._waiters = collections.deque()
+        self._queries = {}
+        # Moving average of how long a run holds its slot
+        self._hold_seconds = None
+
+    def retry_after(self):
+        """Seconds until a new request would likely get a slot"""
+        hold = self._hold_seconds or 10.0
+        return max(1, math.ceil(hold * (len(self._waiters) + 1) / self.max_in_flight))
+
+    def saturated(self):
+        """True when a new request would be rejected right away"""
+        return self._in_flight >= self.max_in_flight and len(self._waiters) >= self.max_queue
+
+    def _update_gauges(self):
+        queue_depth.set(len(self._waiters))
+        in_flight.set(self._in_flight)
+
+    async def acquire(self):
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self._update_gauges()
+            wait_seconds.observe(0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            rejected.inc(reason="queue_full")
+            raise AdmissionRejected("Сервис перегружен, повторите запрос позже", 429, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        started = time.monotonic()
+        try:
+            # The slot is handed over by _release, which resolves the future
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            rejected.inc(reason="wait_timeout")
+            raise AdmissionRejected("Очередь к модели слишком длинная, повторите запрос позже", 503, self.retry_after())
+        except asyncio.CancelledError:
+            # Client went away after the slot was handed over: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            wait_seconds.observe(time.monotonic() - started)
+            self._update_gauges()
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._in_flight -= 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one LLM slot for the duration of the block"""
+        await self.acquire()
+        acquired_at = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - acquired_at
+            self._hold_seconds = held if self._hold_seconds is None else 0.8 * self._hold_seconds + 0.2 * held
+            self._release()
+
+    async def coalesce(self, key, factory):
+        """Await `factory()` once for all concurrent callers with the same `key`"""
+        task = self._queries.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._queries[key] = task
+            task.add_done_callback(lambda _: self._queries.pop(key, None))
+        else:
+            coalesced.inc()
+        # One caller disconnecting must not cancel the run the others wait on
+        return await asyncio.shield(task)
+
+    def status(self):
+        return {
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": len(self._waiters),
+            "max_queue": self.max_queue,
+            "coalescing": len(self._queries),
+        }
+
@@ -0,0 +1,95 @@
+"""Per-request step, tool-call and time budgets for the ReAct agent, and the partial answer when they run out"""
+import asyncio
+import contextvars
+import time
+
+from langgraph.errors import GraphRecursionError
+
+# Budget of the agent run being served; read by the tool wrappers
+current_budget = contextvars.ContextVar("agent_budget", default=None)
+
+PARTIAL_RESULT_CHARS = 1500
+
+EXHAUSTED_REASONS = {
+    "steps": "достигнут лимит шагов агента",
+    "tool_calls": "достигнут лимит вызовов инструментов",
+    "deadline": "истекло время на ответ",
+}
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised by a tool call that would go over the request's budget"""
+
+
+class AgentBudget:
+    """Limits one agent run to `max_steps` model turns, `max_tool_calls` tool calls and `deadline` seconds"""
+
+    def __init__(self, max_steps=6, max_tool_calls=8, deadline=120.0):
+        self.max_steps = max_steps
+        self.max_tool_calls = max_tool_calls
+        self.deadline_at = time.monotonic() + deadline
+        self.tool_calls = 0
+        self.exhausted = None
+
+    def remaining(self):
+        return max(0.0, self.deadline_at - time.monotonic())
+
+    def recursion_limit(self):
+        # Each turn is three graph steps: pre_model_hook, agent and tools. The last turn calls
+        # no tools but is followed by the structured answer step; one more to spare
+        return 3 * self.max_steps + 1
+
+    def take_tool_call(self, name):
+        """Count one tool call, raising BudgetExceeded if the budget does not allow it"""
+        if self.remaining() <= 0:
+            self.exhausted = "deadline"
+        elif self.tool_calls >= self.max_tool_calls:
+            self.exhausted = "tool_calls"
+        else:
+            self.tool_calls += 1
+            return
+        raise BudgetExceeded(f"Инструмент {name} не вызван: {EXHAUSTED_REASONS[self.exhausted]}")
+
+
+async def within_budget(stream, budget):
+    """Yield from an agent stream until it ends or `budget` runs out; `budget.exhausted` says why"""
+    try:
+        while not budget.exhausted:
+            try:
+                item = await asyncio.wait_for(stream.__anext__(), budget.remaining())
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                budget.exhausted = "deadline"
+                return
+            except GraphRecursionError:
+                budget.exhausted = "steps"
+                return
+            yield item
+    finally:
+        await stream.aclose()
+
+
+def tool_results(messages):
+    """(tool name, text) of every successful tool message, oldest first"""
+    results = []
+    for message in messages or []:
+        if getattr(message, "type", None) != "tool" or getattr(message, "status", "success") == "error":
+            continue
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        if content.strip():
+            results.append((message.name, content))
+    return results
+
+
+def partial_answer(results, reason):
+    """(final_output, details) assembled from the tool results gathered before the budget ran out"""
+    details = f"Ответ неполный: {EXHAUSTED_REASONS.get(reason, reason)}."
+    if not results:
+        return "Я не могу найти информацию по Вашему запросу.", details
+    sections = []
+    for name, content in results:
+        if len(content) > PARTIAL_RESULT_CHARS:
+            content = content[:PARTIAL_RESULT_CHARS].rsplit("\n", 1)[0] + "\n…"
+        sections.append(f"### {name}\n\n{content}")
+    return "Поиск не был завершён, но вот что удалось найти:\n\n" + "\n\n".join(sections), details
@@ -0,0 +1,131 @@
+"""Pulls the user-facing answer out of the agent's final state without stringifying it"""
+import json
+import re
+
+from pydantic import ValidationError
+
+from agent_budget import tool_results
+from metrics import registry
+
+UNRECOGNIZED_ANSWER = "Получен ответ от ИИ, но формат не распознан. Попробуйте переформулировать запрос."
+
+# Placeholders small models put into final_output instead of an answer
+PLACEHOLDER_ANSWERS = {"processed_data", "data_processed", "summary", "structured_summary_above", "none"}
+
+THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+extracted = registry.counter("answer_extraction_total", "Final answers by where they were found")
+
+REASK_PROMPT = """/no_think
+Ты — ассистент по поиску туров. Ответь на вопрос пользователя подробно, в формате markdown, используя ТОЛЬКО данные ниже.
+Если данных недостаточно, так и скажи. Не упоминай инструменты и форматы данных."""
+
+
+def message_text(message):
+    """Plain text of a message whose content may be a string or a list of content blocks"""
+    content = getattr(message, "content", "")
+    if isinstance(content, list):
+        content = "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+    return THINK_RE.sub("", content or "").strip()
+
+
+def is_meaningful(text):
+    return bool(text) and len(text.strip()) >= 10 and text.strip().lower() not in PLACEHOLDER_ANSWERS
+
+
+def truncate(text, max_chars):
+    """Cut `text` to `max_chars`, at a paragraph or line break when there is one"""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    boundary = max(cut.rfind("\n\n"), cut.rfind("\n"))
+    return (cut[:boundary] if boundary > max_chars // 2 else cut).rstrip() + "\n\n…"
+
+
+class AnswerExtractor:
+    """Finds (final_output, details) in a LangGraph agent state, cheapest source first.
+
+    Order: the validated structured_response; then the messages in reverse,
+    down to the user's question, for a GenericResponse tool call, a JSON
+    answer or plain answer text; finally, when only tool results exist, a
+    single re-ask of `model` without tools. Answers are capped at `max_chars`.
+    """
+
+    def __init__(self, model, schema, max_chars=12000, reask_chars=6000):
+        self.model = model
+        self.schema = schema
+        self.max_chars = max_chars
+        self.reask_chars = reask_chars
+
+    def _validate(self, value):
+        """Return (final_output, details) if `value` is a meaningful schema instance, dict or JSON text"""
+        try:
+            if isinstance(value, self.schema):
+                answer = value
+            elif isinstance(value, dict):
+                answer = self.schema.model_validate(value)
+            elif isinstance(value, str):
+                text = JSON_FENCE_RE.sub("", THINK_RE.sub("", value).strip())
+                start, end = text.find("{"), text.rfind("}")
+                if start == -1 or end <= start:
+                    return None
+                answer = self.schema.model_validate(json.loads(text[start:end + 1]))
+            else:
+                return None
+        except (ValidationError, ValueError):
+            return None
+        if not is_meaningful(answer.final_output):
+            return None
+        return answer.final_output, answer.details
+
+    def _from_messages(self, messages):
+        for message in reversed(messages):
+            kind = getattr(message, "type", None)
+            if kind == "human":
+                break
+            if kind != "ai":
+                continue
+            for call in getattr(message, "tool_calls", None) or []:
+                if call.get("name") == self.schema.__name__:
+                    found = self._validate(call.get("args"))
+                    if found:
+                        return found
+            text = message_text(message)
+            found = self._validate(text)
+            if found:
+                return found
+            if is_meaningful(text) and not getattr(message, "tool_calls", None):
+                return text, ""
+        return None
+
+    async def _reask(self, messages, user_input):
+        results = tool_results(messages)
+        if not results:
+            return None
+        data = "\n\n".join(f"### {name}\n{content}" for name, content in results)
+        reply = await self.model.ainvoke([
+            ("system", REASK_PROMPT),
+            ("human", f"Вопрос: {user_input}\n\nДанные:\n{truncate(data, self.reask_chars)}"),
+        ])
+        text = message_text(reply)
+        return (text, "") if is_meaningful(text) else None
+
+    async def extract(self, response, user_input):
+        """Return (final_output, details) for the agent state `response`"""
+        response = response if isinstance(response, dict) else {}
+        found = self._validate(response.get("structured_response"))
+        source = "structured"
+        messages = response.get("messages") or []
+        if found is None:
+            found, source = self._from_messages(messages), "messages"
+        if found is None:
+            try:
+                found, source = await self._reask(messages, user_input), "reask"
+            except Exception as e:
+                print(f"Warning: answer re-ask failed: {e}")
+        if found is None:
+            found, source = (UNRECOGNIZED_ANSWER, ""), "unrecognized"
+        extracted.inc(source=source)
+        final_output, details = found
+        return truncate(final_output, self.max_chars), truncate(details or "", self.max_chars)
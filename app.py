@@ -1,20 +1,33 @@
 import os
 import json
-from flask import Flask, render_template, request, jsonify
+from quart import Quart, Response, render_template, request, jsonify
 from pymilvus import MilvusClient
 from langchain_ollama import OllamaEmbeddings, ChatOllama
 from langchain_core.prompts import ChatPromptTemplate
-from langgraph.prebuilt import create_react_agent
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.prebuilt import ToolNode, create_react_agent
 from typing_extensions import Annotated, TypedDict
 from typing import Union
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import asyncio
+import time
+import httpx
+from contextlib import asynccontextmanager
+
+from semantic_cache import SemanticCache, current_data_times
+from admission import AdmissionController, AdmissionRejected
+from agent_budget import AgentBudget, current_budget, partial_answer, tool_results, within_budget
+from answer_extraction import AnswerExtractor
+from context_budget import TOKEN_BUCKETS, compress_tool_result, current_query, trim_messages
+from session_store import SessionStore, current_session, current_turn, tool_call_key
+from tool_cache import split_data_time
+from mcp_client import MCPUnavailable, ManagedMCPClient
+from metrics import PROMETHEUS_CONTENT_TYPE, REQUEST_ID_HEADER, new_request_id, record_span, registry, request_id_var, span
 
 load_dotenv()
 
-app = Flask(__name__)
+app = Quart(__name__)
 
 class ConversationalResponse(TypedDict):
     response: Annotated[str, ..., "A conversational response to the user's query"]
@@ -32,27 +45,98 @@ OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 
 response_model_raw = ChatOllama(model="qwen3:8b", base_url=OLLAMA_BASE_URL)
 
-# Initialize MCP client
-mcp_client = None
-mcp_tools = []
+# Finds the answer in the agent state; re-asks the model without tools only as a last resort
+answer_extractor = AnswerExtractor(
+    response_model_raw,
+    GenericResponse,
+    max_chars=int(os.environ.get("ANSWER_MAX_CHARS", "12000")),
+    reask_chars=int(os.environ.get("ANSWER_REASK_CHARS", "6000")),
+)
+
+# Semantic answer cache: near-identical questions skip the agent entirely.
+# MILVUS_URI may also be a local file path (Milvus Lite), e.g. ./milvus_cache.db; a Milvus Lite
+# file can only be opened by one process, so several workers need a Milvus server URI
+MILVUS_URI = os.environ.get("MILVUS_URI", "./milvus_cache.db")
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+semantic_cache = None
+
+# How long answers built from each tool stay valid, matched by tool name prefix
+SEMANTIC_CACHE_TOOL_TTLS = {
+    "get_hot_tours_": float(os.environ.get("HOT_TOURS_CACHE_TTL", "300")),
+    "latest_news_details": float(os.environ.get("NEWS_CACHE_TTL", "180")),
+    "get_tour_calendar": float(os.environ.get("CALENDAR_CACHE_TTL", "86400")),
+    "get_travel_season": float(os.environ.get("CALENDAR_CACHE_TTL", "86400")),
+}
 
-async def initialize_mcp_client():
-    global mcp_client, mcp_tools
+def is_milvus_lite(uri):
+    return "://" not in uri
+
+def open_semantic_cache():
+    """Connect the semantic cache; runs in each serving process, not at import"""
+    global semantic_cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return
+    if is_milvus_lite(MILVUS_URI) and APP_WORKERS > 1:
+        print(f"Warning: semantic cache disabled: Milvus Lite file {MILVUS_URI} cannot be shared by {APP_WORKERS} workers, set MILVUS_URI to a Milvus server")
+        return
     try:
-        mcp_client = MultiServerMCPClient({
-            "web_search": {
-                "url": "http://127.0.0.1:9010/mcp",
-                "transport": "streamable_http",
-            }
-        })
-        mcp_tools = await mcp_client.get_tools()
-        print(f"✅ MCP tools initialized: {len(mcp_tools)} tools available")
+        semantic_cache = SemanticCache(
+            MilvusClient(uri=MILVUS_URI, token=os.environ.get("MILVUS_TOKEN", "")),
+            OllamaEmbeddings(model=os.environ.get("EMBEDDING_MODEL", "nomic-embed-text:v1.5"), base_url=OLLAMA_BASE_URL),
+            collection_name=os.environ.get("SEMANTIC_CACHE_COLLECTION", "search_answer_cache"),
+            threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            default_ttl=float(os.environ.get("SEMANTIC_CACHE_TTL", "300")),
+            tool_ttls=SEMANTIC_CACHE_TOOL_TTLS,
+        )
+        print("✅ Semantic cache initialized")
     except Exception as e:
-        print(f"Warning: Could not initialize MCP client: {e}")
-        mcp_tools = []
+        print(f"Warning: Could not initialize semantic cache: {e}")
+
+# Multi-turn sessions: requests that send "session_id" continue a conversation kept in SQLite
+SESSIONS_ENABLED = os.environ.get("SESSIONS_ENABLED", "true").lower() == "true"
+sessions = SessionStore(
+    path=os.environ.get("SESSION_DB_PATH", "./sessions.db"),
+    max_turns=int(os.environ.get("SESSION_MAX_TURNS", "6")),
+    idle_ttl=float(os.environ.get("SESSION_IDLE_TTL", "1800")),
+    max_sessions=int(os.environ.get("SESSION_MAX_COUNT", "1000")),
+    tool_ttls=SEMANTIC_CACHE_TOOL_TTLS,
+) if SESSIONS_ENABLED else None
+SESSION_SWEEP_INTERVAL = float(os.environ.get("SESSION_SWEEP_INTERVAL", "60"))
+session_sweeper = None
+
+def prefix_settings(value):
+    """Parse "prefix=number,prefix=number" (tool name prefix -> seconds) from the environment"""
+    settings = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        prefix, _, number = item.partition("=")
+        settings[prefix.strip()] = float(number)
+    return settings
+
+# Per tool call limit; independent calls in one agent step run concurrently
+TOOL_CALL_TIMEOUT = float(os.environ.get("TOOL_CALL_TIMEOUT", "90"))
+
+# Site each scraping tool depends on, matched by tool name prefix; a failing site trips its own circuit breaker
+MCP_TOOL_SITES = {
+    "get_hot_tours": "ht.kz",
+    "latest_news_details": "tengrinews.kz",
+    "get_tour_calendar": "okeanturov.ru",
+    "get_travel_season": "travelv.ru",
+}
+
+# MCP tool server: tool list loaded lazily and refreshed in the background, calls over one pooled HTTP session
+mcp = ManagedMCPClient(
+    os.environ.get("MCP_SERVER_URL", "http://127.0.0.1:9010/mcp"),
+    refresh_interval=float(os.environ.get("MCP_REFRESH_INTERVAL", "300")),
+    connect_timeout=float(os.environ.get("MCP_CONNECT_TIMEOUT", "10")),
+    backoff_max=float(os.environ.get("MCP_BACKOFF_MAX", "60")),
+    max_connections=int(os.environ.get("MCP_MAX_CONNECTIONS", "20")),
+    failure_threshold=int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "3")),
+    reset_timeout=float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "30")),
+    tool_sites=MCP_TOOL_SITES,
+    tool_timeouts=prefix_settings(os.environ.get("MCP_TOOL_TIMEOUTS", "")),
+    default_timeout=TOOL_CALL_TIMEOUT,
+)
 
-# Initialize MCP client on startup
-asyncio.run(initialize_mcp_client())
 
 
 SYSTEM_PROMPT_TEMPLATE = """
@@ -63,6 +147,8 @@ SYSTEM_PROMPT_TEMPLATE = """
 
 ВСЕГДА используйте инструменты для ответа на вопросы. НИКОГДА не отвечайте, используя только свои знания.
 Если ты не можешь ответить с помощью инструмента, напиши: "Я не могу найти информацию по Вашему запросу."
+Если для ответа нужны несколько независимых инструментов (например, туры в разные страны), вызывай их все сразу в одном шаге — они выполняются параллельно.
+Если вопрос уточняет предыдущий и результатов инструментов выше в диалоге достаточно для ответа, отвечай по ним, не вызывая инструменты повторно.
 
 ВАЖНО: В поле final_output вы ДОЛЖНЫ предоставить ПОЛНЫЙ и ПОДРОБНЫЙ ответ пользователю в формате markdown.
 НЕ используйте короткие коды или сокращения типа 'processed_data', 'data_processed', 'summary'.
@@ -72,129 +158,555 @@ SYSTEM_PROMPT_TEMPLATE = """
 
 """
 
+# Default for the per-request "debug" flag: graph tracing and full response dumps
+AGENT_DEBUG = os.environ.get("AGENT_DEBUG", "false").lower() == "true"
+
+# Per request budgets; when one runs out the answer is built from the tool results so far
+AGENT_MAX_STEPS = int(os.environ.get("AGENT_MAX_STEPS", "6"))
+AGENT_MAX_TOOL_CALLS = int(os.environ.get("AGENT_MAX_TOOL_CALLS", "8"))
+AGENT_DEADLINE = float(os.environ.get("AGENT_DEADLINE", "120"))
+
+budget_exhausted = registry.counter("agent_budget_exhausted_total", "Agent runs cut short by a budget, by reason")
+
+# Context budget (estimated tokens): each tool result, and the whole prompt of every model call
+TOOL_MESSAGE_MAX_TOKENS = int(os.environ.get("TOOL_MESSAGE_MAX_TOKENS", "1200"))
+CONTEXT_MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "3500"))
+
+def with_timeout(tool):
+    """Copy of an MCP tool whose calls fail after the tool's timeout (or the request's remaining budget) instead of hanging,
+    and whose output is cut to TOOL_MESSAGE_MAX_TOKENS, keeping what is most relevant to the question.
+    Within a session, a call identical to an earlier one reuses its result while that is fresh.
+    The fetch time the tool server appends to cached data is kept per run for the semantic cache"""
+    call_tool = tool.coroutine
+    
+    def tool_output(result):
+        result, fetched_at = split_data_time(result)
+        data_times = current_data_times.get()
+        if data_times is not None and fetched_at is not None:
+            data_times[tool.name] = min(data_times.get(tool.name, fetched_at), fetched_at)
+        return compress_tool_result(result, current_query.get(), TOOL_MESSAGE_MAX_TOKENS)
+    
+    async def call_with_timeout(*args, **kwargs):
+        session = current_session.get()
+        key = tool_call_key(tool.name, args, kwargs)
+        if session is not None:
+            result = session.reuse_result(key, sessions.ttl_for(tool.name))
+            if result is not None:
+                return tool_output(result)
+        
+        timeout = mcp.timeout_for(tool.name)
+        budget = current_budget.get()
+        if budget is not None:
+            budget.take_tool_call(tool.name)
+            timeout = min(timeout, budget.remaining())
+        result = await mcp.call(tool.name, lambda: call_tool(*args, **kwargs), timeout)
+        if session is not None:
+            session.remember_result(key, result)
+        return tool_output(result)
+    
+    return tool.model_copy(update={"coroutine": call_with_timeout})
+
+def budget_context(state):
+    """pre_model_hook: the model sees the history without stale messages and within CONTEXT_MAX_TOKENS; the state keeps it all"""
+    return {"llm_input_messages": trim_messages(state["messages"], CONTEXT_MAX_TOKENS)}
+
+# Agent runs admitted to the model at once, per app process; the rest wait in a fair queue
+admission = AdmissionController(
+    max_in_flight=int(os.environ.get("LLM_MAX_IN_FLIGHT", "2")),
+    max_queue=int(os.environ.get("LLM_QUEUE_LIMIT", "16")),
+    max_wait=float(os.environ.get("LLM_QUEUE_MAX_WAIT", "30")),
+)
+
+# Compiled agents (one-shot and checkpointed) and their system message, rebuilt only when the MCP tool set changes
+agent = None
+session_agent = None
+system_message = None
+agent_tools_signature = None
+
+def get_agent(session=None):
+    """Return the compiled agent for a one-shot run (or a run in `session`) and the system message for the current MCP tools"""
+    global agent, session_agent, system_message, agent_tools_signature
+    mcp_tools = mcp.tools
+    signature = tuple((tool.name, tool.description) for tool in mcp_tools)
+    if agent is None or signature != agent_tools_signature:
+        with span("agent_build", _tools=len(mcp_tools)):
+            tools_list = "\n".join([f"- {tool.name}: {tool.description}" for tool in mcp_tools]) if mcp_tools else "Нет доступных инструментов"
+            system_message = SYSTEM_PROMPT_TEMPLATE.format(tools_list=tools_list)
+            # ToolNode runs all tool calls of a step concurrently and turns a failing
+            # call into an error message, so the other results still reach the model
+            tool_node = ToolNode([with_timeout(tool) for tool in mcp_tools], handle_tool_errors=True)
+            agent = create_react_agent(response_model_raw, tool_node, response_format=GenericResponse, pre_model_hook=budget_context)
+            session_agent = create_react_agent(
+                response_model_raw, tool_node, response_format=GenericResponse, pre_model_hook=budget_context, checkpointer=sessions.saver
+            ) if sessions is not None and sessions.saver is not None else None
+        agent_tools_signature = signature
+        print(f"✅ Agent built with {len(mcp_tools)} tools")
+    return (session_agent if session is not None else agent), system_message
+
+class AgentMetricsHandler(BaseCallbackHandler):
+    """Records a span for every LLM call (with token counts and prefill time) and tool call of one agent run"""
+    
+    # Run in the request's own context so spans carry its request ID
+    run_inline = True
+    
+    def __init__(self):
+        self._started = {}
+        self.tokens = {"input": 0, "output": 0}
+        self.prefill_seconds = 0.0
+        self.llm_calls = 0
+    
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+    
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = {}
+        metadata = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+                metadata = getattr(message, "response_metadata", None) or generation.generation_info or metadata
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        # Ollama reports how long it spent evaluating the prompt, in nanoseconds
+        prefill_seconds = (metadata.get("prompt_eval_duration") or 0) / 1e9
+        self.tokens["input"] += input_tokens
+        self.tokens["output"] += output_tokens
+        self.prefill_seconds += prefill_seconds
+        self.llm_calls += 1
+        llm_tokens.inc(input_tokens, direction="input")
+        llm_tokens.inc(output_tokens, direction="output")
+        if prefill_seconds:
+            record_span("llm_prefill", prefill_seconds, _input_tokens=input_tokens)
+        self._finish("llm_call", run_id, "ok", _input_tokens=input_tokens, _output_tokens=output_tokens)
+    
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish("llm_call", run_id, "error")
+    
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), serialized.get("name", "tool") if serialized else "tool")
+    
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._finish("tool_call", run_id, "ok")
+    
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._finish("tool_call", run_id, "error")
+    
+    def _finish(self, name, run_id, status, **labels):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        if isinstance(started, tuple):
+            started, labels["tool"] = started
+        record_span(name, time.perf_counter() - started, status, **labels)
+    
+    def record_request(self, endpoint):
+        """Observe the run's totals once it is over"""
+        request_tokens.observe(self.tokens["input"], endpoint=endpoint, direction="input")
+        request_tokens.observe(self.tokens["output"], endpoint=endpoint, direction="output")
+        request_prefill.observe(self.prefill_seconds, endpoint=endpoint)
+        record_span("agent_prefill", self.prefill_seconds, endpoint=endpoint, _llm_calls=self.llm_calls,
+                    _input_tokens=self.tokens["input"], _output_tokens=self.tokens["output"])
+
+llm_tokens = registry.counter("llm_tokens_total", "LLM tokens by direction (input/output)")
+request_tokens = registry.histogram("agent_request_tokens", "LLM tokens per agent run, by direction", TOKEN_BUCKETS)
+request_prefill = registry.histogram("agent_request_prefill_seconds", "Time the model spent on prompt evaluation per agent run")
+search_requests = registry.counter("search_requests_total", "Search requests by endpoint and outcome")
+
+@app.before_serving
+async def startup():
+    """Open the semantic cache and session store, connect to MCP and build the agent on the server's long-lived event loop.
+    An MCP server that is not up yet is retried in the background and by the first request that needs it"""
+    global session_sweeper
+    open_semantic_cache()
+    if sessions is not None:
+        # Requests that send session_id rely on the store, so a broken one stops startup instead of dropping their history
+        try:
+            await sessions.open()
+        except Exception as e:
+            raise RuntimeError(f"Could not open session store {sessions.path}: {e}; set SESSIONS_ENABLED=false to run without sessions") from e
+        session_sweeper = asyncio.create_task(sessions.run_sweeper(SESSION_SWEEP_INTERVAL))
+        print(f"✅ Session store opened: {sessions.path}")
+    try:
+        tools = await mcp.refresh()
+        print(f"✅ MCP tools initialized: {len(tools)} tools available")
+    except Exception:
+        print(f"Warning: Could not initialize MCP client: {mcp.last_error}")
+    mcp.start()
+    get_agent()
+
+@app.after_serving
+async def shutdown():
+    print("Shutting down AI Tour Search")
+    await mcp.close()
+    if session_sweeper is not None:
+        session_sweeper.cancel()
+    if sessions is not None:
+        await sessions.close()
+
+@app.before_request
+async def assign_request_id():
+    """Use the caller's X-Request-ID or make one; it follows the request into MCP tool calls"""
+    request_id_var.set(request.headers.get(REQUEST_ID_HEADER) or new_request_id())
+
+@app.after_request
+async def expose_request_id(response):
+    response.headers[REQUEST_ID_HEADER] = request_id_var.get()
+    return response
+
 @app.route('/') 
-def index():
-    return render_template('index.html')
+async def index():
+    return await render_template('index.html')
+
+async def lookup_cached_answer(user_input):
+    """Return (query_vector, cached answer or None) from the semantic cache"""
+    try:
+        query_vector = await semantic_cache.embed(user_input)
+        cached = await semantic_cache.lookup(query_vector)
+        if cached:
+            print(f"Semantic cache hit ({cached['similarity']:.3f}): {cached['cached_query']}")
+        return query_vector, cached
+    except Exception as e:
+        print(f"Warning: semantic cache lookup failed: {e}")
+        return None, None
+
+async def store_cached_answer(query_vector, user_input, response, final_output, details):
+    # Only well-formed answers backed by tool data are worth reusing
+    tools_used = [message.name for message in response.get("messages", []) if getattr(message, "type", None) == "tool"] if isinstance(response, dict) else []
+    if query_vector is not None and tools_used and "structured_response" in response:
+        try:
+            await semantic_cache.store(query_vector, user_input, final_output, details, tools_used, current_data_times.get())
+        except Exception as e:
+            print(f"Warning: semantic cache store failed: {e}")
+
+def coalesce_key(user_input, debug):
+    """Queries that differ only in case and spacing share one agent run"""
+    return " ".join(user_input.lower().split()), debug
+
+def rejection_response(error):
+    return jsonify({'error': str(error), 'retry_after': error.retry_after}), error.status, {'Retry-After': str(error.retry_after)}
+
+def agent_input(system_message, user_input):
+    return {
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_input}
+        ]
+    }
+
+async def open_session(data):
+    """The session a request continues, or None for a one-shot request (no "session_id" key, or sessions disabled)"""
+    if sessions is None or 'session_id' not in data:
+        return None
+    return await sessions.get(data['session_id'])
+
+@asynccontextmanager
+async def session_turn(session):
+    """Hold `session` for one turn; nothing to hold for a one-shot request"""
+    if session is None:
+        yield
+    else:
+        async with sessions.turn(session):
+            yield
+
+async def prepare_run(agent, session, system_message, user_input):
+    """(graph input, run config, ranking query) for a one-shot run or the next turn of `session`"""
+    if session is None:
+        return agent_input(system_message, user_input), {}, user_input
+    state = await agent.aget_state(session.config())
+    graph_input, query = sessions.turn_input(state.values.get("messages", []), system_message, user_input)
+    return graph_input, session.config(), query
+
+async def answer_with_agent(user_input, query_vector, debug, session=None):
+    """Run the agent once an LLM slot is free; return (final_output, details)"""
+    async with session_turn(session), admission.slot():
+        agent, system_message = get_agent(session)
+        
+        if debug:
+            print("System message:", system_message[:200] + "...")
+            print("User message:", user_input)
+        
+        graph_input, run_config, query = await prepare_run(agent, session, system_message, user_input)
+        budget = AgentBudget(AGENT_MAX_STEPS, AGENT_MAX_TOOL_CALLS, AGENT_DEADLINE)
+        current_budget.set(budget)
+        current_query.set(query)
+        current_data_times.set({})
+        usage = AgentMetricsHandler()
+        config = {**run_config, "callbacks": [usage], "recursion_limit": budget.recursion_limit()}
+        
+        # Each streamed value is the full graph state, so the last one is the answer or what was gathered so far
+        response = None
+        with span("agent_run", endpoint="/search"):
+            stream = agent.astream(graph_input, config=config, stream_mode="values", debug=debug)
+            async for response in within_budget(stream, budget):
+                pass
+        usage.record_request("/search")
+        
+        if debug:
+            print("Agent response keys:", response.keys() if isinstance(response, dict) else "Not a dict")
+            print("Agent response:", response)
+        
+        if budget.exhausted:
+            budget_exhausted.inc(reason=budget.exhausted)
+            return partial_answer(tool_results(current_turn(response.get("messages") if response else None)), budget.exhausted)
+        
+        # The re-ask fallback is another model call, so it still holds the slot
+        final_output, details = await answer_extractor.extract(response, user_input)
+    
+    await store_cached_answer(query_vector, user_input, response, final_output, details)
+    return final_output, details
 
 @app.route('/search', methods=['POST'])
 async def search_tours():
     try:
-        data = request.get_json()
+        data = await request.get_json()
         user_input = data.get('query', '')
         
         if not user_input:
             return jsonify({'error': 'Query is required'}), 400
 
-        # Prepare the prompt
-        tools_list = "\n".join([f"- {tool.name}: {tool.description}" for tool in mcp_tools]) if mcp_tools else "Нет доступных инструментов"
-        
-        USER_PROMPT = f"""
-Ответь на вопрос пользователя максимально точно и подробно: {user_input}
-"""
-
-         
-        # Create agent
-        agent = create_react_agent(response_model_raw, mcp_tools, response_format=GenericResponse, debug=True)
+        debug = bool(data.get('debug', AGENT_DEBUG))
+        session = await open_session(data)
+        # A follow-up depends on the conversation, so only opening questions go through the semantic cache
+        use_cache = semantic_cache is not None and not data.get('no_cache', False) and not (session and session.turns)
+        session_fields = {"session_id": session.id} if session else {}
         
-        # Invoke agent with system prompt
-        system_message = SYSTEM_PROMPT_TEMPLATE.format(tools_list=tools_list)
-        user_message = USER_PROMPT.format(user_input=user_input)
+        # Answer repeated questions from the semantic cache
+        query_vector = None
+        if use_cache:
+            query_vector, cached = await lookup_cached_answer(user_input)
+            if cached:
+                search_requests.inc(endpoint="/search", outcome="cached")
+                return jsonify({
+                    "result": cached["result"],
+                    "details": cached["details"],
+                    "cached": True,
+                    **session_fields
+                })
         
-        print("System message:", system_message[:200] + "...")
-        print("User message:", user_input)
+        # Without the tool server the agent can only apologize, so fail fast instead of spending a model run
+        await mcp.ensure_connected()
         
-        response = await agent.ainvoke({
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_input}
-            ]
-        })
-        
-        print("Agent response type:", type(response))
-        print("Agent response keys:", response.keys() if isinstance(response, dict) else "Not a dict")
-        print("Agent response:", response)
-        
-        # Extract the final answer
-        print("Full response structure:", response)
-        
-        if isinstance(response, dict):
-            # Try to extract from structured_response
-            if "structured_response" in response:
-                structured_response = response["structured_response"]
-                print("Structured response:", structured_response)
-                
-                if hasattr(structured_response, 'final_output'):
-                    final_output = structured_response.final_output
-                    details = getattr(structured_response, 'details', '')
-                elif isinstance(structured_response, dict):
-                    final_output = structured_response.get('final_output', str(structured_response))
-                    details = structured_response.get('details', '')
-                else:
-                    final_output = str(structured_response)
-                    details = ''
-            
-            # Try to extract from other possible keys
-            elif "output" in response:
-                final_output = response["output"]
-                details = response.get("details", "")
-            elif "result" in response:
-                final_output = response["result"]
-                details = response.get("details", "")
-            else:
-                # Try to find any text content in the response
-                final_output = str(response)
-                details = ""
+        if session is not None:
+            final_output, details = await answer_with_agent(user_input, query_vector, debug, session)
         else:
-            final_output = str(response)
-            details = ''
-        
-        # If we still don't have meaningful content, try to extract from the raw response
-        if not final_output or final_output == "None" or len(final_output.strip()) < 10 or final_output in ['processed_data', 'data_processed', 'summary']:
-            # Look for any text content in the response
-            response_str = str(response)
-            
-            # Try to extract from the full response text
-            if "structured_summary_above" in response_str:
-                # Extract content after structured_summary_above
-                parts = response_str.split("structured_summary_above")
-                if len(parts) > 1:
-                    extracted_content = parts[1].strip()
-                    if len(extracted_content) > 20:  # Make sure we have meaningful content
-                        final_output = extracted_content
-                    else:
-                        final_output = "Получен ответ от ИИ, но формат не распознан. Попробуйте переформулировать запрос."
-                else:
-                    final_output = "Получен ответ от ИИ, но формат не распознан. Попробуйте переформулировать запрос."
-            elif "Окончательный ответ:" in response_str:
-                # Extract content after "Окончательный ответ:"
-                parts = response_str.split("Окончательный ответ:")
-                if len(parts) > 1:
-                    extracted_content = parts[1].strip()
-                    if len(extracted_content) > 20:
-                        final_output = extracted_content
-                    else:
-                        final_output = "Получен ответ от ИИ, но формат не распознан. Попробуйте переформулировать запрос."
-                else:
-                    final_output = "Получен ответ от ИИ, но формат не распознан. Попробуйте переформулировать запрос."
-            else:
-                # Try to find any meaningful text in the response
-                if len(response_str) > 100:  # If response is long enough, use it
-                    final_output = response_str
-                else:
-                    final_output = "Получен ответ от ИИ, но формат не распознан. Попробуйте переформулировать запрос."
+            # Identical questions already being answered wait for that run instead of starting another
+            final_output, details = await admission.coalesce(
+                coalesce_key(user_input, debug),
+                lambda: answer_with_agent(user_input, query_vector, debug),
+            )
+        search_requests.inc(endpoint="/search", outcome="answered")
         
         return jsonify({
             "result": final_output,
-            "details": details
+            "details": details,
+            **session_fields
         })
 
+    except AdmissionRejected as e:
+        search_requests.inc(endpoint="/search", outcome="rejected")
+        return rejection_response(e)
+    except MCPUnavailable as e:
+        search_requests.inc(endpoint="/search", outcome="unavailable")
+        return rejection_response(e)
     except Exception as e:
         print(f"Error in search_tours: {e}")
+        search_requests.inc(endpoint="/search", outcome="error")
         return jsonify({'error': str(e)}), 500
 
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def stream_search_events(user_input, use_cache, debug, session=None):
+    """Yield SSE frames for agent steps, tool calls, answer tokens and the final answer"""
+    session_fields = {"session_id": session.id} if session else {}
+    query_vector = None
+    if use_cache:
+        query_vector, cached = await lookup_cached_answer(user_input)
+        if cached:
+            search_requests.inc(endpoint="/search/stream", outcome="cached")
+            yield sse_event("final", {"result": cached["result"], "details": cached["details"], "cached": True, **session_fields})
+            return
+    
+    await mcp.ensure_connected()
+    
+    if admission.status()["in_flight"] >= admission.max_in_flight:
+        yield sse_event("queued", {"position": admission.status()["queued"] + 1})
+    
+    async with session_turn(session), admission.slot():
+        agent, system_message = get_agent(session)
+        tool_started = {}
+        tool_messages = []
+        response = None
+        
+        graph_input, run_config, query = await prepare_run(agent, session, system_message, user_input)
+        budget = AgentBudget(AGENT_MAX_STEPS, AGENT_MAX_TOOL_CALLS, AGENT_DEADLINE)
+        current_budget.set(budget)
+        current_query.set(query)
+        current_data_times.set({})
+        usage = AgentMetricsHandler()
+        config = {**run_config, "callbacks": [usage], "recursion_limit": budget.recursion_limit()}
+        
+        run_started = time.perf_counter()
+        stream = agent.astream_events(graph_input, config=config, version="v2", debug=debug)
+        async for event in within_budget(stream, budget):
+            kind = event["event"]
+            node = event.get("metadata", {}).get("langgraph_node")
+            if kind == "on_chain_start" and event["name"] == node:
+                yield sse_event("step", {"node": node})
+            elif kind == "on_tool_start":
+                tool_started[event["run_id"]] = time.monotonic()
+                yield sse_event("tool_start", {"run_id": str(event["run_id"]), "name": event["name"], "input": event["data"].get("input")})
+            elif kind == "on_tool_end":
+                started = tool_started.pop(event["run_id"], time.monotonic())
+                tool_messages.append(event["data"].get("output"))
+                yield sse_event("tool_end", {"run_id": str(event["run_id"]), "name": event["name"], "seconds": round(time.monotonic() - started, 3)})
+            elif kind == "on_chat_model_stream" and node == "agent":
+                # Answer text; tool-calling turns stream empty content
+                text = event["data"]["chunk"].content
+                if isinstance(text, str) and text:
+                    yield sse_event("token", {"text": text})
+            elif kind == "on_chain_end" and event.get("parent_ids") == []:
+                response = event["data"].get("output")
+        
+        record_span("agent_run", time.perf_counter() - run_started, endpoint="/search/stream")
+        usage.record_request("/search/stream")
+        
+        if not budget.exhausted:
+            final_output, details = await answer_extractor.extract(response, user_input)
+    
+    if budget.exhausted:
+        budget_exhausted.inc(reason=budget.exhausted)
+        final_output, details = partial_answer(tool_results(tool_messages), budget.exhausted)
+        search_requests.inc(endpoint="/search/stream", outcome="partial")
+        yield sse_event("final", {"result": final_output, "details": details, "partial": True, **session_fields})
+        return
+    
+    await store_cached_answer(query_vector, user_input, response, final_output, details)
+    search_requests.inc(endpoint="/search/stream", outcome="answered")
+    yield sse_event("final", {"result": final_output, "details": details, **session_fields})
+
+@app.route('/search/stream', methods=['POST'])
+async def search_tours_stream():
+    data = await request.get_json()
+    user_input = data.get('query', '')
+    
+    if not user_input:
+        return jsonify({'error': 'Query is required'}), 400
+    
+    debug = bool(data.get('debug', AGENT_DEBUG))
+    session = await open_session(data)
+    use_cache = semantic_cache is not None and not data.get('no_cache', False) and not (session and session.turns)
+    
+    # Turn the request away before opening a stream when the queue is already full
+    if admission.saturated():
+        search_requests.inc(endpoint="/search/stream", outcome="rejected")
+        return rejection_response(AdmissionRejected("Сервис перегружен, повторите запрос позже", 429, admission.retry_after()))
+    
+    request_id = request_id_var.get()
+    
+    async def generate():
+        # The body may be iterated outside the request's context
+        request_id_var.set(request_id)
+        try:
+            async for frame in stream_search_events(user_input, use_cache, debug, session):
+                yield frame
+        except AdmissionRejected as e:
+            search_requests.inc(endpoint="/search/stream", outcome="rejected")
+            yield sse_event("error", {"error": str(e), "retry_after": e.retry_after})
+        except MCPUnavailable as e:
+            search_requests.inc(endpoint="/search/stream", outcome="unavailable")
+            yield sse_event("error", {"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Error in search_tours_stream: {e}")
+            search_requests.inc(endpoint="/search/stream", outcome="error")
+            yield sse_event("error", {"error": str(e)})
+    
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Agent runs can outlast Quart's default response timeout
+    response.timeout = None
+    return response
+
+@app.route('/tools/reload', methods=['POST'])
+async def reload_tools():
+    try:
+        tools = await mcp.refresh()
+        get_agent()
+        return jsonify({'tools': [tool.name for tool in tools]})
+    except Exception as e:
+        print(f"Error in reload_tools: {e}")
+        return jsonify({'error': str(e)}), 500
+
+HEALTH_PROBE_TIMEOUT = float(os.environ.get("HEALTH_PROBE_TIMEOUT", "5"))
+
+async def probe_ollama():
+    started = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(timeout=HEALTH_PROBE_TIMEOUT) as client:
+            response = await client.get(f"{OLLAMA_BASE_URL}/api/tags")
+            response.raise_for_status()
+            models = [model.get("name") for model in response.json().get("models", [])]
+    except Exception as e:
+        return {"status": "down", "url": OLLAMA_BASE_URL, "error": str(e) or type(e).__name__}
+    return {
+        "status": "up",
+        "url": OLLAMA_BASE_URL,
+        "latency_ms": round((time.perf_counter() - started) * 1000),
+        "model_available": response_model_raw.model in models,
+    }
+
 @app.route('/health')
-def health_check():
-    return jsonify({'status': 'healthy'})
+async def health_check():
+    """Live status of the MCP server and Ollama with probe latencies, site and tool circuit breakers and local stores.
+    503 when the agent cannot answer at all, "degraded" while some site or tool is failing"""
+    mcp_status, ollama_status = await asyncio.gather(mcp.probe(HEALTH_PROBE_TIMEOUT), probe_ollama())
+    sites = {site: breaker.status() for site, breaker in mcp.site_breakers.items()}
+    tools = {name: breaker.status() for name, breaker in mcp.tool_breakers.items()}
+    if mcp_status["status"] != "up" or ollama_status["status"] != "up":
+        status = "unhealthy"
+    elif (any(breaker["state"] != "closed" for breaker in [*sites.values(), *tools.values()])
+          or mcp_status["breaker"]["state"] != "closed" or not ollama_status["model_available"]):
+        status = "degraded"
+    else:
+        status = "healthy"
+    return jsonify({
+        'status': status,
+        'dependencies': {
+            'mcp': mcp_status,
+            'ollama': ollama_status,
+            'sites': sites,
+            'tools': tools,
+            'semantic_cache': {'enabled': semantic_cache is not None, **(semantic_cache.stats if semantic_cache else {})},
+            'sessions': {'enabled': sessions is not None, **(sessions.status() if sessions else {})},
+        },
+        'admission': admission.status(),
+    }), 503 if status == "unhealthy" else 200
+
+@app.route('/health/live')
+async def liveness():
+    """Process is up and serving; does not touch any dependency"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/metrics')
+async def metrics():
+    """Prometheus metrics of this process: agent runs, LLM and tool calls"""
+    return Response(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+# "dev" runs Quart's development server, "asgi" runs uvicorn with APP_WORKERS processes
+SERVER_MODE = os.environ.get("SERVER_MODE", "dev")
+APP_HOST = os.environ.get("APP_HOST", "127.0.0.1")
+APP_PORT = int(os.environ.get("APP_PORT", "5000"))
+APP_WORKERS = int(os.environ.get("APP_WORKERS", "1"))
 
 if __name__ == '__main__':
-    app.run(host='127.0.0.1', port=5000) 
\ No newline at end of file
+    if SERVER_MODE == "asgi":
+        if SEMANTIC_CACHE_ENABLED and is_milvus_lite(MILVUS_URI) and APP_WORKERS > 1:
+            raise SystemExit(f"APP_WORKERS={APP_WORKERS} needs MILVUS_URI pointing to a Milvus server (or SEMANTIC_CACHE_ENABLED=false): "
+                             f"the Milvus Lite file {MILVUS_URI} cannot be opened by several processes")
+        import uvicorn
+        uvicorn.run("app:app", host=APP_HOST, port=APP_PORT, workers=APP_WORKERS)
+    else:
+        app.run(host=APP_HOST, port=APP_PORT) 
\ No newline at end of file
@@ -0,0 +1,205 @@
+"""Fake Ollama server replaying scripted tool-calling conversations, for offline benchmarks
+
+    python benchmarks/fake_ollama.py --port 11500 --latency 0.8 --tokens-per-second 40
+    OLLAMA_BASE_URL=http://127.0.0.1:11500 python app.py
+
+Implements the parts of the Ollama API the app uses: /api/chat (streamed
+or not, with tool calls and structured output) and /api/embed. The first
+model turn of a conversation calls the tools of the first scenario in
+benchmarks/fixtures/ollama_script.json whose keywords appear in the user
+query; once tool results are in, the model answers from them. Embeddings
+are deterministic hashes of the text.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "ollama_script.json")
+
+
+def load_script(path=SCRIPT_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def fake_embedding(text, dimension):
+    """Unit vector derived from the text, so equal texts embed identically"""
+    values = []
+    counter = 0
+    while len(values) < dimension:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend(byte / 255 - 0.5 for byte in digest)
+        counter += 1
+    values = values[:dimension]
+    norm = math.sqrt(sum(value * value for value in values)) or 1.0
+    return [value / norm for value in values]
+
+
+def approx_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class ScriptedModel:
+    """Chooses the next assistant message from the conversation so far"""
+
+    def __init__(self, script):
+        self.script = script
+
+    def scenario(self, query):
+        query = query.lower()
+        for scenario in self.script["scenarios"]:
+            if not scenario["match"] or any(keyword in query for keyword in scenario["match"]):
+                return scenario
+        return self.script["scenarios"][-1]
+
+    def reply(self, body):
+        """Return (content, tool_calls) for an /api/chat request body"""
+        messages = body.get("messages", [])
+        tools = {tool.get("function", {}).get("name") for tool in body.get("tools") or []}
+        user_query = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        tool_results = [m.get("content", "") for m in messages if m.get("role") == "tool"]
+        answer = self.answer(user_query, tool_results)
+
+        # Structured output requested as a JSON schema (format) or as a forced tool
+        if body.get("format"):
+            return json.dumps(answer, ensure_ascii=False), []
+        if "GenericResponse" in tools:
+            return "", [{"function": {"name": "GenericResponse", "arguments": answer}}]
+
+        if not tool_results and tools:
+            calls = [call for call in self.scenario(user_query)["tool_calls"] if call["name"] in tools]
+            if calls:
+                return "", [{"function": {"name": call["name"], "arguments": call["arguments"]}} for call in calls]
+        return answer["final_output"], []
+
+    def answer(self, query, tool_results):
+        excerpt = "\n\n".join(result[: self.script.get("answer_excerpt_chars", 600)] for result in tool_results)
+        return {
+            "final_output": self.script["final_output"].format(query=query, results=excerpt or "нет данных"),
+            "details": self.script["details"],
+        }
+
+
+def make_handler(model, latency=0.0, jitter=0.0, tokens_per_second=0.0, dimension=768):
+    class OllamaHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _send_json(self, payload, status=200):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _wait(self):
+            delay = latency + random.uniform(-jitter, jitter) if jitter else latency
+            if delay > 0:
+                time.sleep(delay)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._send_json({"models": [{"name": "qwen3:8b"}, {"name": "nomic-embed-text:v1.5"}]})
+            elif self.path in ("/", "/api/version"):
+                self._send_json({"version": "0.0.0-fake"})
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            body = self._read_json()
+            if self.path == "/api/chat":
+                self._chat(body)
+            elif self.path == "/api/embed":
+                inputs = body.get("input", "")
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                self._send_json({"model": body.get("model"), "embeddings": [fake_embedding(text, dimension) for text in inputs]})
+            elif self.path == "/api/embeddings":
+                self._send_json({"embedding": fake_embedding(body.get("prompt", ""), dimension)})
+            elif self.path == "/api/show":
+                self._send_json({"modelfile": "", "parameters": "", "template": "", "capabilities": ["completion", "tools"]})
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def _chat(self, body):
+            started = time.perf_counter()
+            self._wait()
+            content, tool_calls = model.reply(body)
+            prompt_tokens = approx_tokens(json.dumps(body.get("messages", []), ensure_ascii=False))
+            message = {"role": "assistant", "content": content}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            base = {"model": body.get("model"), "created_at": datetime.now(timezone.utc).isoformat()}
+
+            def final_chunk(message):
+                elapsed = int((time.perf_counter() - started) * 1e9)
+                return {
+                    **base, "message": message, "done": True, "done_reason": "stop",
+                    "total_duration": elapsed, "load_duration": 0,
+                    "prompt_eval_count": prompt_tokens, "prompt_eval_duration": int(latency * 1e9),
+                    "eval_count": approx_tokens(content), "eval_duration": max(0, elapsed - int(latency * 1e9)),
+                }
+
+            if not body.get("stream", True):
+                self._send_json(final_chunk(message))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            if tool_calls:
+                self._write_chunk({**base, "message": message, "done": False})
+            else:
+                words = content.split(" ")
+                for i, word in enumerate(words):
+                    if tokens_per_second:
+                        time.sleep(1 / tokens_per_second)
+                    text = word if i == len(words) - 1 else word + " "
+                    self._write_chunk({**base, "message": {"role": "assistant", "content": text}, "done": False})
+            self._write_chunk(final_chunk({"role": "assistant", "content": ""}))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return OllamaHandler
+
+
+def create_server(host="127.0.0.1", port=11500, latency=0.0, jitter=0.0, tokens_per_second=0.0, dimension=768, script_path=SCRIPT_PATH):
+    handler = make_handler(ScriptedModel(load_script(script_path)), latency, jitter, tokens_per_second, dimension)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each chat reply (prefill)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="streaming pace, 0 for instant")
+    parser.add_argument("--dimension", type=int, default=768, help="embedding size")
+    parser.add_argument("--script", default=SCRIPT_PATH)
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.latency, args.jitter, args.tokens_per_second, args.dimension, args.script)
+    print(f"Fake Ollama on http://{args.host}:{args.port} (latency {args.latency}s)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Serves the saved HTML fixtures in place of the scraped sites, for offline benchmarks
+
+    python benchmarks/fixture_server.py --port 8765
+    FETCH_REWRITE_BASE=http://127.0.0.1:8765 python web_tool.py
+
+web_tool.py then fetches https://ht.kz/tours/... from
+http://127.0.0.1:8765/ht.kz/tours/...; every path of a site gets that site's
+fixture. --latency adds a per-response delay to mimic a remote server.
+"""
+import argparse
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Site host -> fixture file
+SITE_FIXTURES = {
+    "ht.kz": "ht_kz_tours.html",
+    "tengrinews.kz": "tengrinews_news.html",
+    "okeanturov.ru": "okeanturov_calendar.html",
+    "www.travelv.ru": "travelv_seasons.html",
+    "travelv.ru": "travelv_seasons.html",
+}
+
+
+def load_fixtures(fixtures_dir=FIXTURES_DIR):
+    pages = {}
+    for host, name in SITE_FIXTURES.items():
+        with open(os.path.join(fixtures_dir, name), "rb") as f:
+            pages[host] = f.read()
+    return pages
+
+
+def make_handler(pages, latency=0.0):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            host = self.path.lstrip("/").split("/", 1)[0]
+            body = pages.get(host)
+            if latency:
+                time.sleep(latency)
+            if body is None:
+                self.send_error(404, f"No fixture for {host}")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FixtureHandler
+
+
+def create_server(host="127.0.0.1", port=8765, latency=0.0, fixtures_dir=FIXTURES_DIR):
+    return ThreadingHTTPServer((host, port), make_handler(load_fixtures(fixtures_dir), latency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.latency)
+    print(f"Serving fixtures for {', '.join(SITE_FIXTURES)} on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
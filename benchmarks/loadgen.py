@@ -0,0 +1,229 @@
+"""Concurrent HTTP load generator for comparing app.py serving modes
+
+Start the app in each mode and point the generator at both, e.g.:
+
+    SERVER_MODE=dev python app.py                         # port 5000
+    SERVER_MODE=asgi APP_PORT=5001 APP_WORKERS=4 python app.py
+    python benchmarks/loadgen.py --target dev=http://127.0.0.1:5000 \
+        --target asgi=http://127.0.0.1:5001 --path /health/live --concurrency 1,8,32
+
+--pid name=PID adds the peak resident memory of that process per level
+(Linux /proc). --offline benchmarks /search end to end without network: it
+starts the fake Ollama server, the fixture server, web_tool.py and app.py,
+then loads /search and reports memory of both processes:
+
+    python benchmarks/loadgen.py --offline --concurrency 1,4,16 --requests-per-level 50
+
+Each request numbers its query ("... (запрос 17)") so that identical
+in-flight queries are not coalesced into one agent run; --same-query sends
+the query unchanged to measure coalescing itself.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import fake_ollama
+import fixture_server
+
+MCP_PORT = 9010
+
+
+def timed_request(url, payload=None, timeout=300):
+    """Return (seconds, ok) for one request"""
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            ok = response.status < 400
+    except Exception:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def rss_mb(pid):
+    """Resident memory of `pid` in MiB, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+class MemorySampler:
+    """Polls the RSS of named processes in the background and keeps the peak of each"""
+
+    def __init__(self, pids, interval=0.1):
+        self.pids = pids
+        self.interval = interval
+        self.peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            for name, pid in self.pids.items():
+                rss = rss_mb(pid)
+                if rss is not None:
+                    self.peaks[name] = max(self.peaks.get(name, 0), rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def request_payload(payload, index, same_query=False):
+    """`payload` for request `index`; its query numbered unless `same_query`"""
+    if payload is None or same_query:
+        return payload
+    return {**payload, "query": f"{payload['query']} (запрос {index + 1})"}
+
+
+def run_load(url, concurrency, total_requests, payload=None, pids=None, same_query=False):
+    """Fire `total_requests` requests with `concurrency` in flight; return latency/throughput/memory stats"""
+    started = time.perf_counter()
+    with MemorySampler(pids or {}) as memory:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(
+                lambda index: timed_request(url, request_payload(payload, index, same_query)), range(total_requests)
+            ))
+    elapsed = time.perf_counter() - started
+    latencies = [seconds for seconds, ok in results if ok]
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": sum(1 for _, ok in results if not ok),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        **{f"{name}_peak_rss_mb": peak for name, peak in memory.peaks.items()},
+    }
+
+
+def wait_for_port(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode}")
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.2)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def start_offline_stack(args, workdir, processes):
+    """Start fake Ollama, fixture server, web_tool.py and app.py into `processes`; return (app base URL, pids)"""
+    for server in (
+        fake_ollama.create_server(port=args.ollama_port, latency=args.ollama_latency, tokens_per_second=args.tokens_per_second),
+        fixture_server.create_server(port=args.fixture_port, latency=args.site_latency),
+    ):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    env = {
+        **os.environ,
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{args.ollama_port}",
+        "FETCH_REWRITE_BASE": f"http://127.0.0.1:{args.fixture_port}",
+        # Measure the agent path: no answer cache, no vector store, no browsers
+        "SEMANTIC_CACHE_ENABLED": "false",
+        "RAG_ENABLED": "false",
+        "PREWARM_ENABLED": "false",
+        "BROWSER_POOL_WARM": "0",
+        "TOOL_CACHE_BACKEND": "memory",
+        "TOUR_CATALOG_PATH": os.path.join(workdir, "tour_catalog.sqlite3"),
+        "TRACE_SPANS": "false",
+        "SERVER_MODE": args.server_mode,
+        "APP_PORT": str(args.app_port),
+    }
+    processes["web_tool"] = subprocess.Popen([sys.executable, "web_tool.py"], cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL)
+    wait_for_port(MCP_PORT, processes["web_tool"])
+    processes["app"] = subprocess.Popen([sys.executable, "app.py"], cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL)
+    wait_for_port(args.app_port, processes["app"])
+    return f"http://127.0.0.1:{args.app_port}", {name: process.pid for name, process in processes.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", help="name=base_url, repeatable")
+    parser.add_argument("--path", default="/health/live")
+    parser.add_argument("--query", help="POST this query as {\"query\": ...} instead of a GET")
+    parser.add_argument("--same-query", action="store_true",
+                        help="send the query unchanged by every request, so in-flight duplicates are coalesced")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests-per-level", type=int, default=200)
+    parser.add_argument("--pid", action="append", default=[], help="name=pid whose peak memory to report, repeatable")
+    offline = parser.add_argument_group("offline mode")
+    offline.add_argument("--offline", action="store_true", help="start the whole stack against local fakes and load /search")
+    offline.add_argument("--server-mode", default="asgi", choices=["dev", "asgi"])
+    offline.add_argument("--app-port", type=int, default=5050)
+    offline.add_argument("--ollama-port", type=int, default=11500)
+    offline.add_argument("--ollama-latency", type=float, default=0.5, help="seconds per fake LLM reply")
+    offline.add_argument("--tokens-per-second", type=float, default=0.0)
+    offline.add_argument("--fixture-port", type=int, default=8765)
+    offline.add_argument("--site-latency", type=float, default=0.2, help="seconds per fixture page")
+    args = parser.parse_args()
+    if not args.offline and not args.target:
+        parser.error("--target is required unless --offline is given")
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    pids = {name: int(pid) for name, pid in (entry.split("=", 1) for entry in args.pid)}
+    processes = {}
+    workdir = tempfile.TemporaryDirectory()
+    try:
+        if args.offline:
+            base_url, stack_pids = start_offline_stack(args, workdir.name, processes)
+            pids.update(stack_pids)
+            targets = [f"offline-{args.server_mode}={base_url}"]
+            path = "/search"
+            payload = {"query": args.query or "Горящие туры во Вьетнам, Таиланд и на Мальдивы"}
+        else:
+            targets = args.target
+            path = args.path
+            payload = {"query": args.query} if args.query else None
+
+        for target in targets:
+            name, base_url = target.split("=", 1)
+            for level in levels:
+                stats = run_load(base_url.rstrip("/") + path, level, max(level, args.requests_per_level), payload, pids,
+                                 args.same_query)
+                print(json.dumps({"target": name, **stats}, ensure_ascii=False))
+    finally:
+        for process in processes.values():
+            process.terminate()
+            process.wait(timeout=10)
+        workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Parse-time benchmark: previous BeautifulSoup tour extraction vs the lxml extractors
+
+    python benchmarks/parse_benchmark.py [page.html ...] [--repeat 50]
+
+Defaults to the saved fixtures in benchmarks/fixtures. Save a real listing
+with the browser ("Save page as...") to benchmark against live markup.
+Also reports how large each tool output is, as a proxy for prompt tokens.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import bs4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from destinations import HOT_TOURS_BASE_URL, HOT_TOURS_HOTEL_SELECTOR, HOT_TOURS_PRICE_SELECTOR, HOT_TOURS_ROW_SELECTOR
+from extraction import ItemExtractor, TourExtractor
+from tour_output import render_tours
+
+# Nested row/content/price classes the tools used to match
+LEGACY_SELECTOR = ".ng-row, .ng-content, .ng-prices, .href"
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def extract_with_bs4(page_source):
+    """The per-country tool body as it was before the destination registry"""
+    soup = bs4.BeautifulSoup(page_source, 'html.parser')
+    tour_items = []
+    for element in soup.find_all(class_=["ng-row", "ng-content", "ng-prices", "href"]):
+        text_content = element.get_text(strip=True)
+        link_element = element.find('a')
+        url = None
+        if link_element:
+            url = link_element.get('href')
+            if url and url.startswith('/'):
+                url = f"{HOT_TOURS_BASE_URL}{url}"
+        if text_content:
+            tour_items.append({"content": text_content, "urls": url})
+    return tour_items
+
+
+def time_parser(parse, page_source, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse(page_source)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pages = args.pages or [
+        os.path.join(FIXTURES_DIR, name) for name in sorted(os.listdir(FIXTURES_DIR)) if name.startswith("ht_kz")
+    ]
+    extractor = ItemExtractor(LEGACY_SELECTOR, HOT_TOURS_BASE_URL)
+    tour_extractor = TourExtractor(HOT_TOURS_ROW_SELECTOR, HOT_TOURS_HOTEL_SELECTOR, HOT_TOURS_PRICE_SELECTOR, HOT_TOURS_BASE_URL)
+    for path in pages:
+        with open(path, encoding="utf-8") as f:
+            page_source = f.read()
+        legacy_items = extract_with_bs4(page_source)
+        fast_items = extractor.extract(page_source)
+        records = tour_extractor.extract(page_source)
+        legacy_ms = time_parser(extract_with_bs4, page_source, args.repeat)
+        fast_ms = time_parser(extractor.extract, page_source, args.repeat)
+        records_ms = time_parser(tour_extractor.extract, page_source, args.repeat)
+        print(f"{os.path.basename(path)}: {len(page_source) / 1024:.0f} KiB, "
+              f"bs4/html.parser {legacy_ms:.2f} ms, lxml {fast_ms:.2f} ms, "
+              f"speedup x{legacy_ms / fast_ms:.1f}, "
+              f"items {len(legacy_items)}/{len(fast_items)} identical={legacy_items == fast_items}")
+
+        legacy_output = json.dumps({"tour_items": legacy_items, "total_count": len(legacy_items)}, ensure_ascii=False, indent=4)
+        print(f"  tour records: {len(records)} in {records_ms:.2f} ms; tool output "
+              f"{len(legacy_output)} chars (old indent=4 JSON) -> "
+              f"{len(render_tours(records, 'json'))} (json) / {len(render_tours(records))} (table)")
+
+
+if __name__ == "__main__":
+    main()
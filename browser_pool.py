@@ -0,0 +1,163 @@
+"""Bounded pool of reusable headless Chrome sessions for the web tools"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+
+from metrics import span
+
+
+def build_chrome_options():
+    """Chrome options shared by every pooled browser"""
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # Run in background
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1920,1080")
+    chrome_options.add_argument("--disable-web-security")
+    chrome_options.add_argument("--disable-features=VizDisplayCompositor")
+    chrome_options.add_argument("--log-level=3")  # Suppress most logs
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-logging"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    return chrome_options
+
+
+def create_chrome_driver():
+    return webdriver.Chrome(options=build_chrome_options())
+
+
+class PooledBrowser:
+    """A warm Chrome session plus the bookkeeping needed to recycle it"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.base_handle = driver.current_window_handle
+        self.pages_served = 0
+        self.created_at = time.monotonic()
+
+    def is_healthy(self):
+        try:
+            self.driver.execute_script("return 1")
+            return self.base_handle in self.driver.window_handles
+        except WebDriverException:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except WebDriverException:
+            pass
+
+
+class BrowserPool:
+    """Keeps at most `size` Chrome processes alive and hands them out one caller at a time.
+
+    Browsers are created lazily (or up front with `warm`), health-checked on
+    checkout and recycled after `max_pages` pages. Each `page()` call runs in
+    its own tab with cookies cleared afterwards, so callers never see each
+    other's state.
+    """
+
+    def __init__(self, size=2, max_pages=50, checkout_timeout=120, driver_factory=create_chrome_driver):
+        self.size = size
+        self.max_pages = max_pages
+        self.checkout_timeout = checkout_timeout
+        self._driver_factory = driver_factory
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"created": 0, "reused": 0, "recycled": 0, "unhealthy": 0}
+
+    def _create(self):
+        with span("browser_startup"):
+            browser = PooledBrowser(self._driver_factory())
+        with self._lock:
+            self.stats["created"] += 1
+        return browser
+
+    def warm(self, count=None):
+        """Start `count` browsers ahead of the first request"""
+        count = self.size if count is None else min(count, self.size)
+        browsers = [self.checkout() for _ in range(count)]
+        for browser in browsers:
+            self.checkin(browser)
+
+    def checkout(self, timeout=None):
+        """Take a healthy browser out of the pool, starting one if none is idle"""
+        if self._closed:
+            raise RuntimeError("Browser pool is closed")
+        timeout = self.checkout_timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No browser available after {timeout}s (pool size {self.size})")
+        try:
+            while True:
+                try:
+                    browser = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create()
+                if browser.is_healthy():
+                    with self._lock:
+                        self.stats["reused"] += 1
+                    return browser
+                with self._lock:
+                    self.stats["unhealthy"] += 1
+                browser.quit()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def checkin(self, browser, healthy=True):
+        """Return a browser to the pool, quitting it if it is worn out or broken"""
+        try:
+            if self._closed or not healthy or browser.pages_served >= self.max_pages:
+                with self._lock:
+                    self.stats["recycled"] += 1
+                browser.quit()
+            else:
+                self._idle.put(browser)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def page(self):
+        """Yield a driver focused on a fresh tab of a pooled browser"""
+        with span("browser_checkout"):
+            browser = self.checkout()
+        driver = browser.driver
+        try:
+            driver.switch_to.new_window("tab")
+        except WebDriverException:
+            self.checkin(browser, healthy=False)
+            raise
+        try:
+            yield driver
+        finally:
+            browser.pages_served += 1
+            healthy = True
+            try:
+                driver.close()
+                driver.switch_to.window(browser.base_handle)
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            except WebDriverException:
+                healthy = False
+            self.checkin(browser, healthy=healthy)
+
+    def status(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update({"size": self.size, "idle": self._idle.qsize()})
+        return stats
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().quit()
+            except queue.Empty:
+                break
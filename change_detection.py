@@ -0,0 +1,69 @@
+"""Fingerprints scraped pages and items so unchanged content is not re-parsed or re-indexed"""
+import hashlib
+import re
+import threading
+import time
+
+from tour_catalog import tour_identity
+
+# Parts of a page that change on every load without the content changing
+VOLATILE_MARKUP_RE = re.compile(r'<script\b.*?</script>|<style\b.*?</style>|<!--.*?-->|\s+', re.DOTALL | re.IGNORECASE)
+
+def page_fingerprint(page_source):
+    """Hash of the page markup without scripts, styles, comments and whitespace"""
+    return hashlib.sha256(VOLATILE_MARKUP_RE.sub("", page_source or "").encode("utf-8")).hexdigest()
+
+
+def diff_tours(old_records, new_records, key=tour_identity):
+    """Compare two tour listings by offer identity (the catalogue's key); returns added, removed and price_changed lists"""
+    old = {key(record): record for record in old_records}
+    new = {key(record): record for record in new_records}
+    price_changed = []
+    for key in old.keys() & new.keys():
+        if old[key].get("price") != new[key].get("price"):
+            price_changed.append({**new[key], "old_price": old[key].get("price")})
+    return {
+        "added": [new[key] for key in new.keys() - old.keys()],
+        "removed": [old[key] for key in old.keys() - new.keys()],
+        "price_changed": price_changed,
+        "unchanged": len(old.keys() & new.keys()) - len(price_changed),
+    }
+
+
+class ChangeTracker:
+    """Remembers the last fingerprint and result per source, and the last diff of its items"""
+
+    def __init__(self):
+        self._snapshots = {}
+        self._changes = {}
+        self._lock = threading.Lock()
+        self.stats = {"unchanged_pages": 0, "changed_pages": 0}
+
+    def unchanged_result(self, source, fingerprint):
+        """The previous result for `source` if its page fingerprint has not changed, else None"""
+        with self._lock:
+            snapshot = self._snapshots.get(source)
+            if snapshot is not None and snapshot["fingerprint"] == fingerprint:
+                self.stats["unchanged_pages"] += 1
+                return snapshot["result"]
+            self.stats["changed_pages"] += 1
+            return None
+
+    def update(self, source, fingerprint, result, records=None):
+        """Store a new snapshot; for item listings return the diff against the previous one.
+
+        Returns None on the first snapshot of a source, when there is
+        nothing to diff against and consumers should process everything.
+        """
+        with self._lock:
+            previous = self._snapshots.get(source)
+            self._snapshots[source] = {"fingerprint": fingerprint, "result": result, "records": records}
+            if previous is None or records is None or previous["records"] is None:
+                return None
+            delta = diff_tours(previous["records"], records)
+            self._changes[source] = {**delta, "detected_at": time.time()}
+            return delta
+
+    def changes(self, source):
+        with self._lock:
+            return self._changes.get(source)
@@ -0,0 +1,190 @@
+"""Keeps tool output and conversation history inside the model's context budget"""
+import contextvars
+import json
+import math
+import re
+
+from metrics import registry
+
+# Question of the agent run being served; tool output is ranked against it
+current_query = contextvars.ContextVar("current_query", default="")
+
+# Rough characters per token for mixed Russian/English text and markup
+CHARS_PER_TOKEN = 3.0
+
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+tool_tokens = registry.counter("context_tool_tokens_total", "Estimated tool output tokens before (raw) and after (sent) compression")
+prompt_tokens = registry.histogram("context_prompt_tokens", "Estimated prompt tokens per model call after trimming", TOKEN_BUCKETS)
+stubbed_messages = registry.counter("context_stubbed_messages_total", "Stale messages reduced to a stub before a model call")
+
+WORD_RE = re.compile(r"\w+")
+
+
+def approx_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def query_terms(query):
+    """Lower-cased word stems of the query; the first five letters cover most Russian inflections"""
+    return {word[:5] for word in WORD_RE.findall(query.lower()) if len(word) >= 3}
+
+
+def relevance(text, terms):
+    text = text.lower()
+    return sum(1 for term in terms if term in text)
+
+
+def select_items(items, terms, max_tokens):
+    """Indexes of the most query-relevant items that fit in `max_tokens`, in original order"""
+    ranked = sorted(range(len(items)), key=lambda i: (-relevance(items[i], terms), i))
+    chosen = []
+    used = 0
+    for i in ranked:
+        cost = approx_tokens(items[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        chosen.append(i)
+        used += cost
+    return sorted(chosen)
+
+
+def _compress_json(data, terms, max_tokens):
+    """Shrink the longest list in a JSON tool result; None when there is no list to shrink"""
+    container, key = None, None
+    if isinstance(data, list):
+        items = data
+    elif isinstance(data, dict):
+        lists = [(name, value) for name, value in data.items() if isinstance(value, list)]
+        if not lists:
+            return None
+        key, items = max(lists, key=lambda pair: len(json.dumps(pair[1], ensure_ascii=False)))
+        container = {name: value for name, value in data.items() if name != key}
+    else:
+        return None
+
+    overhead = approx_tokens(json.dumps(container, ensure_ascii=False)) if container else 0
+    encoded = [json.dumps(item, ensure_ascii=False, separators=(",", ":")) for item in items]
+    keep = select_items(encoded, terms, max(max_tokens - overhead - 16, 0))
+    kept = [items[i] for i in keep]
+    if container is None:
+        result = kept
+    else:
+        result = {**container, key: kept}
+        if len(kept) < len(items):
+            result["omitted"] = len(items) - len(kept)
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+
+
+def _compress_lines(text, terms, max_tokens):
+    """Keep section titles, table headers and footers; rank the remaining lines by relevance"""
+    lines = text.split("\n")
+    fixed = set()
+    for i, line in enumerate(lines):
+        starts_block = i == 0 or not lines[i - 1].strip() or lines[i - 1].startswith("#")
+        if not line.strip() or line.startswith("#") or line.startswith("shown ") or (starts_block and "|" in line):
+            fixed.add(i)
+    fixed_tokens = sum(approx_tokens(lines[i]) + 1 for i in fixed)
+    candidates = [i for i in range(len(lines)) if i not in fixed]
+    keep = select_items([lines[i] for i in candidates], terms, max(max_tokens - fixed_tokens - 16, 0))
+    kept = fixed | {candidates[i] for i in keep}
+    omitted = len(candidates) - len(keep)
+    result = "\n".join(lines[i] for i in sorted(kept))
+    if omitted:
+        result += f"\n… ещё {omitted} строк опущено"
+    return result
+
+
+def shrink_text(text, query, max_tokens):
+    """Fit one tool output into `max_tokens`, keeping the items most relevant to `query`"""
+    if approx_tokens(text) <= max_tokens:
+        return text
+    terms = query_terms(query)
+    compressed = None
+    stripped = text.strip()
+    if stripped[:1] in "[{":
+        try:
+            compressed = _compress_json(json.loads(stripped), terms, max_tokens)
+        except ValueError:
+            compressed = None
+    if compressed is None:
+        compressed = _compress_lines(text, terms, max_tokens)
+    # Whatever is left over budget (one huge item) is cut
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    if len(compressed) > max_chars:
+        compressed = compressed[:max_chars] + "…"
+    return compressed
+
+
+def compress_text(text, query, max_tokens):
+    """shrink_text, counting tool output tokens before and after"""
+    compressed = shrink_text(text, query, max_tokens)
+    tool_tokens.inc(approx_tokens(text), stage="raw")
+    tool_tokens.inc(approx_tokens(compressed), stage="sent")
+    return compressed
+
+
+def compress_tool_result(result, query, max_tokens):
+    """Apply compress_text to an MCP tool result: a string, a list of strings, or (content, artifact)"""
+    if isinstance(result, tuple) and len(result) == 2:
+        return compress_tool_result(result[0], query, max_tokens), result[1]
+    if isinstance(result, str):
+        return compress_text(result, query, max_tokens)
+    if isinstance(result, list):
+        return [compress_text(item, query, max_tokens) if isinstance(item, str) else item for item in result]
+    return result
+
+
+def message_tokens(message):
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    calls = getattr(message, "tool_calls", None)
+    return approx_tokens(content) + (approx_tokens(json.dumps(calls, ensure_ascii=False)) if calls else 0) + 4
+
+
+def trim_messages(messages, max_tokens):
+    """Messages for the next model call, without stale content and within `max_tokens`.
+
+    Stale: failed tool calls that were retried later, tool results repeated
+    by a later identical result, and the reasoning text of earlier
+    tool-calling turns. Their messages stay (tool calls and results must
+    pair up) but shrink to a stub. If the rest is still over budget, the
+    tool results share what is left and are compressed to fit.
+    """
+    later_tools = set()
+    later_results = set()
+    stale = set()
+    for i in range(len(messages) - 1, -1, -1):
+        message = messages[i]
+        kind = getattr(message, "type", None)
+        if kind == "tool":
+            content = message.content if isinstance(message.content, str) else None
+            failed = getattr(message, "status", "success") == "error"
+            if (failed and message.name in later_tools) or (content is not None and (message.name, content) in later_results):
+                stale.add(i)
+            elif not failed:
+                later_tools.add(message.name)
+                later_results.add((message.name, content))
+        elif kind == "ai" and getattr(message, "tool_calls", None) and message.content and i < len(messages) - 1:
+            stale.add(i)
+
+    trimmed = []
+    for i, message in enumerate(messages):
+        if i in stale:
+            stub = "" if message.type == "ai" else f"[устаревший результат {message.name}, см. ниже]"
+            message = message.model_copy(update={"content": stub})
+            stubbed_messages.inc()
+        trimmed.append(message)
+
+    total = sum(message_tokens(message) for message in trimmed)
+    tools = [i for i, message in enumerate(trimmed) if getattr(message, "type", None) == "tool" and i not in stale]
+    if total > max_tokens and tools:
+        tool_total = sum(message_tokens(trimmed[i]) for i in tools)
+        share = max((max_tokens - (total - tool_total)) // len(tools), 64)
+        query = current_query.get()
+        for i in tools:
+            if isinstance(trimmed[i].content, str):
+                trimmed[i] = trimmed[i].model_copy(update={"content": shrink_text(trimmed[i].content, query, share)})
+        total = sum(message_tokens(message) for message in trimmed)
+
+    prompt_tokens.observe(total)
+    return trimmed
@@ -0,0 +1,21 @@
+"""Hot tour destinations served by the web tool: one entry per country.
+
+Adding a country is one line here; web_tool.py generates its MCP tool,
+cache entry, prewarm job and get_hot_tours slug from this registry.
+"""
+
+HOT_TOURS_BASE_URL = "https://ht.kz"
+
+# One tour per row on ht.kz listing pages; the row count also tells the
+# browser when the listing has finished loading
+HOT_TOURS_ROW_SELECTOR = ".ng-row"
+HOT_TOURS_HOTEL_SELECTOR = ".ng-content a"
+HOT_TOURS_PRICE_SELECTOR = ".ng-prices"
+
+# slug -> MCP tool name, Russian destination phrase for the description, listing URL
+DESTINATIONS = {
+    "vietnam": {"tool_name": "get_hot_tours_vietnam", "title": "во Вьетнам", "url": "https://ht.kz/tours/vietnam-from-almaty"},
+    "turkey": {"tool_name": "get_hot_tours_tyrkey", "title": "в Турцию", "url": "https://ht.kz/tours/turkey-from-almaty"},
+    "thailand": {"tool_name": "get_hot_tours_thailand", "title": "в Тайланд", "url": "https://ht.kz/tours/thailand-from-almaty"},
+    "maldives": {"tool_name": "get_hot_tours_maldives", "title": "на Мальдивы", "url": "https://ht.kz/tours/maldives-from-almaty"},
+}
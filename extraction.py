@@ -0,0 +1,140 @@
+"""Fast item extraction from scraped pages using lxml and precompiled CSS selectors"""
+import datetime
+import re
+
+import lxml.html
+from lxml.cssselect import CSSSelector
+
+
+class ItemExtractor:
+    """Extracts {"content", "urls"} items for every element matching a CSS selector.
+
+    The selector is compiled to XPath once, at construction, and pages are
+    parsed with lxml's C parser. Output matches the BeautifulSoup path the
+    tools used before: stripped text joined without separators, plus the
+    first link inside the element made absolute against `base_url`.
+    """
+
+    def __init__(self, selector, base_url):
+        self.selector = selector
+        self.base_url = base_url.rstrip("/")
+        self._match = CSSSelector(selector)
+        self._first_link = CSSSelector("a")
+
+    def text(self, element):
+        return "".join(part.strip() for part in element.itertext())
+
+    def link(self, element):
+        links = [link for link in self._first_link(element) if link is not element]
+        if not links:
+            return None
+        url = links[0].get('href')
+        if url and url.startswith('/'):
+            url = f"{self.base_url}{url}"
+        return url
+
+    def extract(self, page_source):
+        if not page_source or not page_source.strip():
+            return []
+        document = lxml.html.fromstring(page_source)
+        items = []
+        for element in self._match(document):
+            text_content = self.text(element)
+            if text_content:
+                items.append({
+                    "content": text_content,
+                    "urls": self.link(element)
+                })
+        return items
+
+
+STARS_RE = re.compile(r'(\d)\s*(?:\*|★|зв)')
+NIGHTS_RE = re.compile(r'(\d{1,2})\s*(?:ноч|нч|н\.)', re.IGNORECASE)
+DATE_RE = re.compile(r'\b(\d{2})\.(\d{2})(?:\.(\d{4}))?\b')
+PRICE_RE = re.compile(
+    r'(\d{1,3}(?:\s\d{3})+|\d+)\s*(₸|тг\.?|тенге|kzt|\$|usd|€|eur|₽|руб\.?|rub)',
+    re.IGNORECASE,
+)
+CURRENCIES = {"₸": "KZT", "тг": "KZT", "тенге": "KZT", "kzt": "KZT", "$": "USD", "usd": "USD",
+              "€": "EUR", "eur": "EUR", "₽": "RUB", "руб": "RUB", "rub": "RUB"}
+
+
+def departure_date(day, month, year=None, today=None):
+    """ISO date of a listing's departure; a date shown without a year is the next one to come. None if invalid"""
+    today = today or datetime.date.today()
+    # 29.02 may only exist in a later year
+    years = [int(year)] if year else range(today.year, today.year + 5)
+    for candidate in years:
+        try:
+            date = datetime.date(candidate, int(month), int(day))
+        except ValueError:
+            continue
+        if year or date >= today:
+            return date.isoformat()
+    return None
+
+
+class TourExtractor:
+    """Parses each tour row into one typed, de-duplicated record.
+
+    Rows are matched by `row_selector` only, so the nested content/price
+    blocks no longer repeat the same text. Fields are read from the row
+    text: hotel (first link inside `hotel_selector`), stars, nights,
+    departure date (ISO; the next such date when the year is not shown), the
+    lowest price in `price_selector` in the currency of its first price, and
+    the hotel link.
+    """
+
+    def __init__(self, row_selector, hotel_selector, price_selector, base_url):
+        self.links = ItemExtractor(row_selector, base_url)
+        self._rows = CSSSelector(row_selector)
+        self._hotel = CSSSelector(hotel_selector)
+        self._price = CSSSelector(price_selector)
+
+    def parse_row(self, row):
+        text = " ".join(part.strip() for part in row.itertext() if part.strip())
+        hotel_links = self._hotel(row)
+        hotel = " ".join(hotel_links[0].text_content().split()) if hotel_links else None
+        if hotel:
+            hotel = STARS_RE.sub("", hotel).strip() or None
+
+        stars = STARS_RE.search(text)
+        nights = NIGHTS_RE.search(text)
+        date = DATE_RE.search(text)
+        departure = departure_date(*date.groups()) if date else None
+
+        price_blocks = self._price(row) or [row]
+        price_text = " ".join(" ".join(block.itertext()) for block in price_blocks)
+        prices = [
+            (int(re.sub(r'\D', '', amount)), CURRENCIES.get(symbol.lower().rstrip('.'), symbol))
+            for amount, symbol in PRICE_RE.findall(price_text)
+        ]
+        # Amounts are only comparable within one currency, e.g. a KZT price next to its USD equivalent
+        price, currency = min(price for price in prices if price[1] == prices[0][1]) if prices else (None, None)
+
+        return {
+            "hotel": hotel,
+            "stars": int(stars.group(1)) if stars else None,
+            "nights": int(nights.group(1)) if nights else None,
+            "departure": departure,
+            "price": price,
+            "currency": currency,
+            "url": self.links.link(row),
+        }
+
+    def extract(self, page_source):
+        if not page_source or not page_source.strip():
+            return []
+        document = lxml.html.fromstring(page_source)
+        records = []
+        seen = set()
+        for row in self._rows(document):
+            record = self.parse_row(row)
+            if record["hotel"] is None and record["price"] is None:
+                continue
+            key = (record["hotel"], record["stars"], record["nights"], record["departure"], record["price"], record["currency"])
+            if key in seen:
+                continue
+            seen.add(key)
+            records.append(record)
+        return records
@@ -0,0 +1,104 @@
+"""Picks the cheapest way to fetch each page: plain HTTP first, headless Chrome as fallback"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+import bs4
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP = "http"
+BROWSER = "browser"
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+    ),
+    "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
+}
+
+
+def create_http_session(pool_size=10):
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class PageFetcher:
+    """Fetches pages over a pooled HTTP session when the expected content is in the static HTML.
+
+    The first call for a URL tries HTTP and checks that `target_selector`
+    matches; if it does not, the page is rendered with `browser_loader`
+    instead. The winning strategy is remembered per URL so later calls skip
+    straight to it. Pages stuck on the browser are re-probed over HTTP every
+    `reprobe_after` seconds in case the site changes.
+
+    With `rewrite_base` set, `https://host/path` is fetched from
+    `<rewrite_base>/host/path` instead, e.g. a local fixture server.
+    """
+
+    def __init__(self, browser_loader, session=None, timeout=15, reprobe_after=3600, rewrite_base=None):
+        self.browser_loader = browser_loader
+        self.session = session or create_http_session()
+        self.timeout = timeout
+        self.reprobe_after = reprobe_after
+        self.rewrite_base = rewrite_base.rstrip("/") if rewrite_base else None
+        self._strategies = {}
+        self._lock = threading.Lock()
+
+    def _fetch_http(self, url, target_selector):
+        """Return the static HTML, or None when it lacks the expected content"""
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"HTTP fetch of {url} failed: {e}")
+            return None
+        if response.encoding is None or response.encoding.lower() == "iso-8859-1":
+            response.encoding = response.apparent_encoding
+        html = response.text
+        if target_selector and bs4.BeautifulSoup(html, 'html.parser').select_one(target_selector) is None:
+            return None
+        return html
+
+    def _record(self, url, strategy):
+        with self._lock:
+            self._strategies[url] = (strategy, time.time())
+
+    def _preferred(self, url):
+        with self._lock:
+            entry = self._strategies.get(url)
+        if entry is None:
+            return HTTP
+        strategy, recorded_at = entry
+        if strategy == BROWSER and time.time() - recorded_at >= self.reprobe_after:
+            return HTTP
+        return strategy
+
+    def _rewrite(self, url):
+        if not self.rewrite_base:
+            return url
+        parts = urlsplit(url)
+        return f"{self.rewrite_base}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+    def fetch(self, url, target_selector=None, **browser_kwargs):
+        """Return the page source using the cheapest strategy that yields `target_selector`"""
+        url = self._rewrite(url)
+        probed = self._preferred(url) == HTTP
+        if probed:
+            html = self._fetch_http(url, target_selector)
+            if html is not None:
+                self._record(url, HTTP)
+                return html
+        html = self.browser_loader(url, target_selector=target_selector, **browser_kwargs)
+        if probed:
+            self._record(url, BROWSER)
+        return html
+
+    def strategies(self):
+        with self._lock:
+            return {url: strategy for url, (strategy, _) in self._strategies.items()}
@@ -0,0 +1,302 @@
+"""Managed connection to the MCP tool server: lazy retrying connect, tool list refresh, pooled HTTP and circuit breakers"""
+import asyncio
+import math
+import time
+
+import httpx
+from langchain_core.tools import ToolException
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from metrics import REQUEST_ID_HEADER, registry, request_id_var
+
+breaker_open = registry.gauge("circuit_breaker_open", "1 while a circuit breaker fails calls fast, by name")
+connect_attempts = registry.counter("mcp_connect_attempts_total", "Attempts to load the MCP tool list, by outcome")
+list_tools_seconds = registry.histogram("mcp_list_tools_seconds", "Latency of loading the MCP tool list")
+rejected_calls = registry.counter("mcp_rejected_calls_total", "Tool calls failed fast by an open circuit breaker, by breaker")
+
+
+class MCPUnavailable(Exception):
+    """Raised instead of running the agent while the MCP server cannot be reached; carries a Retry-After hint"""
+
+    status = 503
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fails calls fast for `reset_timeout` seconds after `failure_threshold` consecutive failures.
+
+    Once that time has passed one trial call goes through (half-open): its
+    success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.latency = None
+        self._opened_at = None
+        self._trial_at = None
+        breaker_open.set(0, name=name)
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self):
+        """True if a call may go ahead now"""
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        # A trial whose caller never reported back does not block the breaker forever
+        if state == "half_open" and (self._trial_at is None or now - self._trial_at >= self.reset_timeout):
+            self._trial_at = now
+            return True
+        return False
+
+    def retry_after(self):
+        if self._opened_at is None:
+            return 0
+        return max(1, math.ceil(self.reset_timeout - (time.monotonic() - self._opened_at)))
+
+    def record_success(self, latency=None):
+        self.failures = 0
+        self._opened_at = None
+        self._trial_at = None
+        if latency is not None:
+            self.latency = latency
+        breaker_open.set(0, name=self.name)
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_at = None
+        if self._opened_at is not None or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            breaker_open.set(1, name=self.name)
+
+    def status(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+        }
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """Lets short-lived httpx clients use one long-lived connection pool; closing the client leaves the pool open"""
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+
+class ManagedMCPClient:
+    """Keeps the tool list of one MCP server loaded and the calls to it healthy.
+
+    The tool list is loaded lazily: at startup, by the first request that
+    needs it, and by a background loop that retries with exponential backoff
+    while the server is down and refreshes the list every `refresh_interval`
+    seconds while it is up. All MCP calls share one HTTP connection pool.
+
+    A circuit breaker for the server, one per scraped site (tool name prefix
+    -> site in `tool_sites`) and one per tool that scrapes no site makes calls
+    fail fast while it is open.
+    Tool calls time out after the prefix-matched `tool_timeouts` entry, or
+    `default_timeout`.
+    """
+
+    def __init__(self, url, refresh_interval=300.0, connect_timeout=10.0, backoff_initial=1.0, backoff_max=60.0,
+                 max_connections=20, failure_threshold=3, reset_timeout=30.0,
+                 tool_sites=None, tool_timeouts=None, default_timeout=90.0):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.connect_timeout = connect_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.tool_sites = tool_sites or {}
+        self.tool_timeouts = tool_timeouts or {}
+        self.default_timeout = default_timeout
+        self.tools = []
+        self.breaker = CircuitBreaker("mcp", failure_threshold, reset_timeout)
+        self.site_breakers = {}
+        self.tool_breakers = {}
+        self.last_refresh = None
+        self.last_error = None
+        self._backoff = backoff_initial
+        self._connect_lock = asyncio.Lock()
+        self._task = None
+        self._pool = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            retries=1,
+        )
+        self._client = MultiServerMCPClient({
+            "web_search": {
+                "url": url,
+                "transport": "streamable_http",
+                "httpx_client_factory": self._http_client,
+            }
+        })
+
+    def _http_client(self, headers=None, timeout=None, auth=None):
+        """Client for one MCP call over the shared pool; forwards the current request ID to the tool server"""
+        async def add_request_id(request):
+            request.headers[REQUEST_ID_HEADER] = request_id_var.get()
+
+        return httpx.AsyncClient(
+            transport=SharedTransport(self._pool),
+            headers=headers,
+            timeout=timeout or httpx.Timeout(30.0, read=300.0),
+            auth=auth,
+            follow_redirects=True,
+            event_hooks={"request": [add_request_id]},
+        )
+
+    def site_for(self, tool_name):
+        return next((site for prefix, site in self.tool_sites.items() if tool_name.startswith(prefix)), None)
+
+    def timeout_for(self, tool_name):
+        return next((timeout for prefix, timeout in self.tool_timeouts.items() if tool_name.startswith(prefix)), self.default_timeout)
+
+    def site_breaker(self, site):
+        breaker = self.site_breakers.get(site)
+        if breaker is None:
+            breaker = self.site_breakers[site] = CircuitBreaker(site, self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def tool_breaker(self, tool_name):
+        """Breaker charged with the tool's own failures: its site's, else one of its own"""
+        site = self.site_for(tool_name)
+        if site:
+            return self.site_breaker(site)
+        breaker = self.tool_breakers.get(tool_name)
+        if breaker is None:
+            breaker = self.tool_breakers[tool_name] = CircuitBreaker(tool_name, self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    async def refresh(self):
+        """Load the tool list now; raises if the server cannot be reached"""
+        started = time.perf_counter()
+        try:
+            tools = await asyncio.wait_for(self._client.get_tools(), self.connect_timeout)
+        except Exception as e:
+            self.breaker.record_failure()
+            self.last_error = str(e) or type(e).__name__
+            connect_attempts.inc(outcome="error")
+            raise
+        latency = time.perf_counter() - started
+        list_tools_seconds.observe(latency)
+        connect_attempts.inc(outcome="ok")
+        self.breaker.record_success(latency)
+        self.tools = tools
+        self.last_refresh = time.time()
+        self.last_error = None
+        self._backoff = self.backoff_initial
+        return tools
+
+    async def ensure_connected(self):
+        """Return the tool list, loading it first if needed; MCPUnavailable while the server is down"""
+        if self.tools and self.breaker.state == "closed":
+            return self.tools
+        if not self.breaker.allow():
+            raise MCPUnavailable("Сервер инструментов недоступен, повторите запрос позже", self.breaker.retry_after())
+        async with self._connect_lock:
+            if self.tools and self.breaker.state == "closed":
+                return self.tools
+            try:
+                return await self.refresh()
+            except Exception:
+                raise MCPUnavailable(f"Сервер инструментов недоступен: {self.last_error}", max(1, self.breaker.retry_after()))
+
+    async def call(self, tool_name, call_tool, timeout):
+        """Await `call_tool()` within `timeout`, failing fast while the server or the tool's site is unhealthy.
+
+        Timeouts and tool errors count against the tool's site (or the tool
+        itself, for tools that do not scrape a site); only transport errors
+        count against the server.
+        """
+        target = self.tool_breaker(tool_name)
+        for breaker in (self.breaker, target):
+            if not breaker.allow():
+                rejected_calls.inc(breaker=breaker.name)
+                raise ToolException(f"Инструмент {tool_name} временно недоступен: {breaker.name} не отвечает, повтор через {breaker.retry_after()} с")
+
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(call_tool(), timeout)
+        except asyncio.TimeoutError:
+            target.record_failure()
+            raise TimeoutError(f"Инструмент {tool_name} не ответил за {timeout:.0f} с")
+        except ToolException:
+            target.record_failure()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        latency = time.perf_counter() - started
+        self.breaker.record_success()
+        target.record_success(latency)
+        return result
+
+    async def _run(self):
+        while True:
+            if self.tools and self.breaker.state == "closed":
+                await asyncio.sleep(self.refresh_interval)
+            else:
+                await asyncio.sleep(self._backoff)
+            try:
+                await self.refresh()
+            except Exception:
+                self._backoff = min(self._backoff * 2, self.backoff_max)
+                print(f"Warning: MCP tool list refresh failed ({self.last_error}); next attempt in {self._backoff:.0f} s")
+
+    def start(self):
+        """Start the background reconnect/refresh loop on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._pool.aclose()
+
+    async def probe(self, timeout=5.0):
+        """Live check for /health: one HTTP round trip to the server over the shared pool.
+
+        Any HTTP response means the server is reachable (a bare GET gets a
+        4xx from the MCP endpoint). The cached tool list and the breaker are
+        reported as they are and never changed here.
+        """
+        started = time.perf_counter()
+        try:
+            async with httpx.AsyncClient(transport=SharedTransport(self._pool), timeout=timeout) as client:
+                response = await client.get(self.url, headers={"Accept": "text/event-stream"})
+            status = "up" if response.status_code < 500 else "down"
+            error = None if status == "up" else f"HTTP {response.status_code}"
+        except Exception as e:
+            status = "down"
+            error = str(e) or type(e).__name__
+        return {
+            "status": status,
+            "url": self.url,
+            "probe_latency_ms": round((time.perf_counter() - started) * 1000),
+            "tools": len(self.tools),
+            "last_refresh_age_s": round(time.time() - self.last_refresh) if self.last_refresh else None,
+            "error": error or self.last_error,
+            "breaker": self.breaker.status(),
+        }
@@ -0,0 +1,147 @@
+"""Timing spans, request-ID propagation and Prometheus text metrics shared by app.py and web_tool.py"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Request ID of the /search call being served; follows asyncio tasks and tool worker threads
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+TRACE_SPANS = os.environ.get("TRACE_SPANS", "true").lower() == "true"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    pairs = list(label_key) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, kind="counter"):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def counter(self, name, help_text):
+        return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def gauge(self, name, help_text):
+        return self._metrics.setdefault(name, Counter(name, help_text, kind="gauge"))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+span_seconds = registry.histogram("span_duration_seconds", "Duration of traced spans by name")
+
+
+@contextmanager
+def span(name, **labels):
+    """Time a block into span_duration_seconds{span=name,...} and log it with the request ID.
+
+    Labels starting with an underscore (URLs, counts) are only logged, so
+    they do not blow up the number of metric series. The yielded dict can be
+    updated inside the block to add such details.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield labels
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record_span(name, time.perf_counter() - started, status, **labels)
+
+
+def record_span(name, seconds, status="ok", **labels):
+    """Record a span whose duration was measured elsewhere, e.g. from callback start/end events"""
+    span_seconds.observe(seconds, span=name, status=status, **{k: v for k, v in labels.items() if not k.startswith("_")})
+    if TRACE_SPANS:
+        print(json.dumps({
+            "span": name,
+            "request_id": request_id_var.get(),
+            "seconds": round(seconds, 4),
+            "status": status,
+            **{k.lstrip("_"): v for k, v in labels.items()},
+        }, ensure_ascii=False))
@@ -0,0 +1,91 @@
+"""Background scheduler that keeps the scraped tool data hot between agent calls"""
+import heapq
+import random
+import threading
+import time
+
+
+class PrewarmJob:
+    def __init__(self, name, refresh, interval):
+        self.name = name
+        self.refresh = refresh
+        self.interval = interval
+        self.refreshed_at = None
+        self.last_duration = None
+        self.last_error = None
+        self.refreshes = 0
+
+
+class Prewarmer:
+    """Runs each registered refresh on its own interval, with jitter, on one background thread.
+
+    Jobs run one at a time so prewarming never takes more than one browser
+    away from live tool calls. The refreshed result itself lives wherever the
+    refresh function stores it (the tool cache); the prewarmer only tracks
+    how old each snapshot is and how long it took.
+    """
+
+    def __init__(self, jitter=0.1, initial_stagger=5):
+        self.jitter = jitter
+        self.initial_stagger = initial_stagger
+        self._jobs = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, name, refresh, interval):
+        self._jobs[name] = PrewarmJob(name, refresh, interval)
+
+    def keep_warm(self, interval, name=None):
+        """Decorator registering a cached tool's `refresh` as a prewarm job"""
+        def decorator(func):
+            self.register(name or func.__name__, func.refresh, interval)
+            return func
+        return decorator
+
+    def _next_delay(self, job):
+        return job.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _run_job(self, job):
+        started = time.monotonic()
+        try:
+            job.refresh()
+            job.refreshed_at = time.time()
+            job.last_error = None
+            job.refreshes += 1
+        except Exception as e:
+            job.last_error = str(e)
+            print(f"Warning: prewarm of {job.name} failed: {e}")
+        job.last_duration = time.monotonic() - started
+
+    def _loop(self):
+        now = time.monotonic()
+        schedule = [(now + i * self.initial_stagger, name) for i, name in enumerate(self._jobs)]
+        heapq.heapify(schedule)
+        while schedule and not self._stop.is_set():
+            due, name = heapq.heappop(schedule)
+            if self._stop.wait(max(0, due - time.monotonic())):
+                break
+            job = self._jobs[name]
+            self._run_job(job)
+            heapq.heappush(schedule, (time.monotonic() + self._next_delay(job), name))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="prewarm", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        now = time.time()
+        return {
+            name: {
+                "age_seconds": round(now - job.refreshed_at, 1) if job.refreshed_at else None,
+                "last_refresh_seconds": round(job.last_duration, 3) if job.last_duration is not None else None,
+                "interval_seconds": job.interval,
+                "refreshes": job.refreshes,
+                "last_error": job.last_error,
+            }
+            for name, job in self._jobs.items()
+        }
@@ -0,0 +1,158 @@
+"""Milvus index of scraped tour, news and calendar passages for semantic retrieval"""
+import hashlib
+import re
+import threading
+
+# Sources are tool names; anything else is refused before it reaches a Milvus filter expression
+SOURCE_RE = re.compile(r"^\w+$")
+
+
+def chunk_text(text, max_chars=800, overlap=100):
+    """Split long text on whitespace into chunks of at most `max_chars`, overlapping by `overlap`"""
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return [text] if text else []
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + max_chars)
+        if end < len(text):
+            space = text.rfind(" ", start + overlap + 1, end)
+            if space != -1:
+                end = space
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        # Start the next chunk on a word boundary inside the overlap
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return chunks
+
+
+def source_filter(source):
+    if not SOURCE_RE.match(source):
+        raise ValueError(f"Invalid source name: {source!r}")
+    return f'source == "{source}"'
+
+
+def content_id(source, text):
+    return hashlib.sha256(f"{source}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+
+class RagIndex:
+    """Chunks, embeds and stores passages per source, embedding only content it has not seen.
+
+    Chunks are keyed by a hash of source and text, so re-ingesting an
+    unchanged page costs one id lookup and no embedding calls. Chunks that
+    are no longer part of a source are deleted.
+    """
+
+    def __init__(self, client, embeddings, collection_name="travel_content", batch_size=32, max_chars=800):
+        self.client = client
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._collection_ready = False
+        self.stats = {"embedded": 0, "skipped": 0, "deleted": 0}
+
+    def _ensure_collection(self, dimension):
+        if self._collection_ready:
+            return
+        if not self.client.has_collection(self.collection_name):
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                dimension=dimension,
+                id_type="string",
+                max_length=64,
+                metric_type="COSINE",
+                auto_id=False,
+            )
+        self._collection_ready = True
+
+    def _existing_ids(self, source):
+        if not self._collection_ready:
+            return set()
+        rows = self.client.query(
+            collection_name=self.collection_name,
+            filter=source_filter(source),
+            output_fields=["id"],
+        )
+        return {row["id"] for row in rows}
+
+    def ingest(self, source, passages):
+        """Index `passages` as the current content of `source`; return how many chunks were embedded"""
+        chunks = {}
+        for passage in passages:
+            for chunk in chunk_text(passage, self.max_chars):
+                chunks[content_id(source, chunk)] = chunk
+
+        with self._lock:
+            if not self._collection_ready and chunks:
+                probe = self.embeddings.embed_query(next(iter(chunks.values())))
+                self._ensure_collection(len(probe))
+            existing = self._existing_ids(source)
+            new_ids = [chunk_id for chunk_id in chunks if chunk_id not in existing]
+            stale_ids = list(existing - chunks.keys())
+
+            for start in range(0, len(new_ids), self.batch_size):
+                batch = new_ids[start:start + self.batch_size]
+                vectors = self.embeddings.embed_documents([chunks[chunk_id] for chunk_id in batch])
+                self.client.upsert(collection_name=self.collection_name, data=[
+                    {"id": chunk_id, "vector": vector, "source": source, "text": chunks[chunk_id]}
+                    for chunk_id, vector in zip(batch, vectors)
+                ])
+            if stale_ids:
+                self.client.delete(collection_name=self.collection_name, ids=stale_ids)
+
+            self.stats["embedded"] += len(new_ids)
+            self.stats["skipped"] += len(chunks) - len(new_ids)
+            self.stats["deleted"] += len(stale_ids)
+        return len(new_ids)
+
+    def apply_changes(self, source, added_passages, removed_passages):
+        """Embed only passages that appeared and delete the ones that went away"""
+        removed_ids = [content_id(source, chunk) for passage in removed_passages for chunk in chunk_text(passage, self.max_chars)]
+        chunks = {}
+        for passage in added_passages:
+            for chunk in chunk_text(passage, self.max_chars):
+                chunks[content_id(source, chunk)] = chunk
+
+        with self._lock:
+            if not self._collection_ready and chunks:
+                probe = self.embeddings.embed_query(next(iter(chunks.values())))
+                self._ensure_collection(len(probe))
+            chunk_ids = list(chunks)
+            for start in range(0, len(chunk_ids), self.batch_size):
+                batch = chunk_ids[start:start + self.batch_size]
+                vectors = self.embeddings.embed_documents([chunks[chunk_id] for chunk_id in batch])
+                self.client.upsert(collection_name=self.collection_name, data=[
+                    {"id": chunk_id, "vector": vector, "source": source, "text": chunks[chunk_id]}
+                    for chunk_id, vector in zip(batch, vectors)
+                ])
+            stale_ids = [chunk_id for chunk_id in removed_ids if chunk_id not in chunks]
+            if stale_ids and self._collection_ready:
+                self.client.delete(collection_name=self.collection_name, ids=stale_ids)
+
+            self.stats["embedded"] += len(chunks)
+            self.stats["deleted"] += len(stale_ids)
+        return len(chunks)
+
+    def search(self, query, top_k=5, source=None):
+        """Return the `top_k` passages closest to `query` as {"source", "text", "score"}"""
+        if not self._collection_ready and not self.client.has_collection(self.collection_name):
+            return []
+        self._collection_ready = True
+        hits = self.client.search(
+            collection_name=self.collection_name,
+            data=[self.embeddings.embed_query(query)],
+            limit=top_k,
+            filter=source_filter(source) if source else "",
+            output_fields=["source", "text"],
+        )[0]
+        return [
+            {"source": hit["entity"]["source"], "text": hit["entity"]["text"], "score": round(hit["distance"], 3)}
+            for hit in hits
+        ]
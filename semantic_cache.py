@@ -0,0 +1,105 @@
+"""Milvus-backed cache of answers to semantically similar /search queries"""
+import asyncio
+import contextvars
+import time
+
+# Oldest fetch time of the data each tool returned during the agent run being served, by tool name
+current_data_times = contextvars.ContextVar("current_data_times", default=None)
+
+
+class SemanticCache:
+    """Returns a stored answer when a new query embeds close enough to a previous one.
+
+    Each entry expires with the data it was built from: its lifetime is the
+    shortest remaining freshness among the tools the agent called, the tool's
+    TTL minus the age of the data it returned. An answer about hot tours goes
+    stale together with the hot tour data, and one built from data that was
+    already stale is not stored.
+    """
+
+    def __init__(self, client, embeddings, collection_name="search_answer_cache",
+                 threshold=0.92, default_ttl=300, tool_ttls=None):
+        self.client = client
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.threshold = threshold
+        self.default_ttl = default_ttl
+        self.tool_ttls = tool_ttls or {}
+        self._collection_ready = False
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "stale_skips": 0}
+
+    def ttl_for(self, tools_used, data_times=None):
+        """Shortest remaining freshness among the tools an answer depends on: TTL (matched by name prefix) minus data age"""
+        now = time.time()
+        data_times = data_times or {}
+        ttls = []
+        for tool_name in tools_used:
+            ttl = next((ttl for prefix, ttl in self.tool_ttls.items() if tool_name.startswith(prefix)), self.default_ttl)
+            if data_times.get(tool_name) is not None:
+                ttl -= max(0.0, now - data_times[tool_name])
+            ttls.append(ttl)
+        return min(ttls) if ttls else self.default_ttl
+
+    def _ensure_collection(self, dimension):
+        if self._collection_ready:
+            return
+        if not self.client.has_collection(self.collection_name):
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                dimension=dimension,
+                metric_type="COSINE",
+                auto_id=True,
+            )
+        self._collection_ready = True
+
+    def _search(self, vector):
+        self._ensure_collection(len(vector))
+        hits = self.client.search(
+            collection_name=self.collection_name,
+            data=[vector],
+            limit=1,
+            filter=f"expires_at > {time.time()}",
+            output_fields=["query", "result", "details"],
+        )[0]
+        if hits and hits[0]["distance"] >= self.threshold:
+            return hits[0]
+        return None
+
+    def _insert(self, vector, query, result, details, ttl):
+        self._ensure_collection(len(vector))
+        now = time.time()
+        self.client.delete(collection_name=self.collection_name, filter=f"expires_at <= {now}")
+        self.client.insert(collection_name=self.collection_name, data=[{
+            "vector": vector,
+            "query": query,
+            "result": result,
+            "details": details,
+            "created_at": now,
+            "expires_at": now + ttl,
+        }])
+
+    async def embed(self, query):
+        return await self.embeddings.aembed_query(query)
+
+    async def lookup(self, vector):
+        """Return {"result", "details", "similarity", "cached_query"} for a close match, else None"""
+        hit = await asyncio.to_thread(self._search, vector)
+        if hit is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        entity = hit["entity"]
+        return {
+            "result": entity["result"],
+            "details": entity["details"],
+            "similarity": hit["distance"],
+            "cached_query": entity["query"],
+        }
+
+    async def store(self, vector, query, result, details, tools_used, data_times=None):
+        ttl = self.ttl_for(tools_used, data_times)
+        if ttl <= 0:
+            self.stats["stale_skips"] += 1
+            return
+        await asyncio.to_thread(self._insert, vector, query, result, details, ttl)
+        self.stats["stores"] += 1
@@ -0,0 +1,213 @@
+"""Multi-turn /search sessions: LangGraph checkpoints in SQLite, bounded history, idle eviction and tool result reuse"""
+import asyncio
+import collections
+import contextvars
+import json
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from metrics import registry
+
+# Session of the agent run being served; read by the tool wrappers
+current_session = contextvars.ContextVar("current_session", default=None)
+
+SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Fixed ID so each turn replaces the system message in place instead of appending another
+SYSTEM_MESSAGE_ID = "system"
+
+INTERRUPTED_CALL = "Вызов инструмента прерван: ответ на предыдущий вопрос не был завершён."
+
+active_sessions = registry.gauge("sessions_active", "Sessions held in memory by this process")
+evicted_sessions = registry.counter("sessions_evicted_total", "Sessions deleted, by reason (idle/capacity)")
+tool_reuse = registry.counter("session_tool_reuse_total", "Tool calls answered from an earlier result of the same session")
+
+
+def current_turn(messages):
+    """Messages after the last user message: what the latest agent run added"""
+    messages = messages or []
+    for i in range(len(messages) - 1, -1, -1):
+        if getattr(messages[i], "type", None) == "human":
+            return messages[i + 1:]
+    return messages
+
+
+def tool_call_key(name, args, kwargs):
+    return name, json.dumps([args, kwargs], ensure_ascii=False, sort_keys=True, default=str)
+
+
+class Session:
+    """One conversation: its checkpoint thread, a lock that runs its turns one at a time, and its tool results"""
+
+    def __init__(self, session_id, turns=0, max_tool_results=32):
+        self.id = session_id
+        self.turns = turns
+        self.lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+        self.max_tool_results = max_tool_results
+        self._tool_results = collections.OrderedDict()
+
+    def config(self):
+        return {"configurable": {"thread_id": self.id}}
+
+    def reuse_result(self, key, ttl):
+        """Result of an identical earlier tool call no older than `ttl` seconds, else None"""
+        entry = self._tool_results.get(key)
+        if entry is None or time.monotonic() - entry[1] > ttl:
+            return None
+        self._tool_results.move_to_end(key)
+        tool_reuse.inc(tool=key[0])
+        return entry[0]
+
+    def remember_result(self, key, result):
+        self._tool_results[key] = (result, time.monotonic())
+        self._tool_results.move_to_end(key)
+        while len(self._tool_results) > self.max_tool_results:
+            self._tool_results.popitem(last=False)
+
+
+class SessionStore:
+    """Keeps /search conversations in a SQLite LangGraph checkpointer.
+
+    A session keeps its last `max_turns` questions with their answers and tool
+    results. Sessions idle for `idle_ttl` seconds, and the least recently used
+    ones beyond `max_sessions`, are deleted by `sweep`. Tool results are kept
+    in memory per session and reused for identical calls while younger than
+    the tool's TTL (matched by name prefix in `tool_ttls`, else `idle_ttl`).
+    """
+
+    def __init__(self, path="./sessions.db", max_turns=6, idle_ttl=1800.0, max_sessions=1000, tool_ttls=None):
+        self.path = path
+        self.max_turns = max(1, max_turns)
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.tool_ttls = tool_ttls or {}
+        self.saver = None
+        self._conn = None
+        self._sessions = {}
+
+    async def open(self):
+        """Open the database; must run on the event loop that serves requests"""
+        self._conn = await aiosqlite.connect(self.path)
+        self.saver = AsyncSqliteSaver(self._conn)
+        await self.saver.setup()
+        await self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_activity (thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL, turns INTEGER NOT NULL)"
+        )
+        await self._conn.commit()
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    def ttl_for(self, tool_name):
+        return next((ttl for prefix, ttl in self.tool_ttls.items() if tool_name.startswith(prefix)), self.idle_ttl)
+
+    async def get(self, session_id):
+        """The session for a client-supplied ID; an unknown or malformed ID starts a new one"""
+        if not (isinstance(session_id, str) and SESSION_ID_RE.match(session_id)):
+            session_id = uuid.uuid4().hex
+        session = self._sessions.get(session_id)
+        if session is None:
+            async with self.saver.lock:
+                async with self._conn.execute("SELECT turns FROM session_activity WHERE thread_id = ?", (session_id,)) as cursor:
+                    row = await cursor.fetchone()
+            session = Session(session_id, turns=row[0] if row else 0)
+            self._sessions[session_id] = session
+            active_sessions.set(len(self._sessions))
+        return session
+
+    @asynccontextmanager
+    async def turn(self, session):
+        """Run one turn of `session`: turns of the same session wait for each other"""
+        async with session.lock:
+            token = current_session.set(session)
+            try:
+                yield session
+            finally:
+                current_session.reset(token)
+                session.turns += 1
+                session.last_seen = time.monotonic()
+                async with self.saver.lock:
+                    await self._conn.execute(
+                        "INSERT INTO session_activity (thread_id, last_seen, turns) VALUES (?, ?, 1) "
+                        "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen, turns = turns + 1",
+                        (session.id, time.time()),
+                    )
+                    await self._conn.commit()
+
+    def turn_input(self, messages, system_message, user_input):
+        """(graph input, query for ranking tool output) for the next turn after the stored `messages`.
+
+        Turns beyond `max_turns` are removed from the stored history, tool calls
+        left unanswered by a run that was cut short get an error result, and
+        the structured answer of the previous turn is cleared.
+        """
+        update = [SystemMessage(content=system_message, id=SYSTEM_MESSAGE_ID)]
+        questions = [i for i, message in enumerate(messages) if message.type == "human"]
+        kept = messages
+        if len(questions) >= self.max_turns:
+            cut = questions[len(questions) - self.max_turns + 1]
+            update += [RemoveMessage(id=message.id) for message in messages[:cut] if message.id != SYSTEM_MESSAGE_ID]
+            kept = messages[cut:]
+
+        answered = {message.tool_call_id for message in kept if message.type == "tool"}
+        for message in kept:
+            for call in getattr(message, "tool_calls", None) or []:
+                if call["id"] not in answered:
+                    update.append(ToolMessage(content=INTERRUPTED_CALL, tool_call_id=call["id"], name=call["name"], status="error"))
+
+        update.append(HumanMessage(content=user_input))
+        # A follow-up like "а подешевле?" is ranked together with the question it refines
+        previous = [message.content for message in kept if message.type == "human" and isinstance(message.content, str)]
+        query = " ".join(previous[-1:] + [user_input])
+        return {"messages": update, "structured_response": None}, query
+
+    async def sweep(self):
+        """Delete sessions idle longer than `idle_ttl` and the least recently used beyond `max_sessions`"""
+        async with self.saver.lock:
+            async with self._conn.execute(
+                "SELECT thread_id FROM session_activity WHERE last_seen < ?", (time.time() - self.idle_ttl,)
+            ) as cursor:
+                idle = [row[0] for row in await cursor.fetchall()]
+            async with self._conn.execute(
+                "SELECT thread_id FROM session_activity ORDER BY last_seen DESC LIMIT -1 OFFSET ?", (self.max_sessions,)
+            ) as cursor:
+                surplus = [row[0] for row in await cursor.fetchall() if row[0] not in idle]
+
+        for reason, thread_ids in (("idle", idle), ("capacity", surplus)):
+            for thread_id in thread_ids:
+                session = self._sessions.get(thread_id)
+                if session is not None and session.lock.locked():
+                    continue
+                await self.saver.adelete_thread(thread_id)
+                async with self.saver.lock:
+                    await self._conn.execute("DELETE FROM session_activity WHERE thread_id = ?", (thread_id,))
+                    await self._conn.commit()
+                self._sessions.pop(thread_id, None)
+                evicted_sessions.inc(reason=reason)
+
+        # Sessions whose first turn never finished have no activity row yet
+        cutoff = time.monotonic() - self.idle_ttl
+        for session_id, session in list(self._sessions.items()):
+            if session.last_seen < cutoff and not session.lock.locked():
+                del self._sessions[session_id]
+        active_sessions.set(len(self._sessions))
+
+    def status(self):
+        return {"active": len(self._sessions), "max_turns": self.max_turns, "idle_ttl": self.idle_ttl}
+
+    async def run_sweeper(self, interval=60.0):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Warning: session sweep failed: {e}")
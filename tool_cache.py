@@ -0,0 +1,229 @@
+"""TTL result cache with stale-while-revalidate for the MCP scraping tools"""
+import contextvars
+import functools
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# When the data served to the current tool call was fetched; collected per call by the MCP tool wrapper
+served_data_times = contextvars.ContextVar("served_data_times", default=None)
+
+# Appended to a tool result so the agent side knows how old the data behind it is
+DATA_TIME_RE = re.compile(r"\n\[data_time: (\d+(?:\.\d+)?)\]$")
+
+
+def note_data_time(fetched_at):
+    collector = served_data_times.get()
+    if collector is not None:
+        collector.append(fetched_at)
+
+
+def with_data_time(result, fetched_at):
+    return f"{result}\n[data_time: {fetched_at:.0f}]"
+
+
+def split_data_time(result):
+    """(result without its data time, data time or None); also takes a (content, artifact) tool result"""
+    if isinstance(result, tuple) and len(result) == 2:
+        content, fetched_at = split_data_time(result[0])
+        return (content, result[1]), fetched_at
+    if isinstance(result, str):
+        match = DATA_TIME_RE.search(result)
+        if match:
+            return result[:match.start()], float(match.group(1))
+    return result, None
+
+
+class MemoryBackend:
+    """In-process LRU store of (value, stored_at) pairs"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at):
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """On-disk LRU store so cached results survive a server restart"""
+
+    def __init__(self, path, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tool_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tool_cache_accessed ON tool_cache (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM tool_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE tool_cache SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                )
+                self._conn.commit()
+            return row
+
+    def set(self, key, value, stored_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tool_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, stored_at, time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM tool_cache WHERE key NOT IN "
+                "(SELECT key FROM tool_cache ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM tool_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tool_cache").fetchone()[0]
+
+
+class ToolCache:
+    """Serves tool results from a backend, refreshing them in the background once stale.
+
+    An entry younger than `ttl` is fresh. Up to `stale_ttl` seconds after that
+    it is still served immediately while one background refresh runs. Older
+    entries are treated as misses. Concurrent misses or refreshes for the same
+    key share a single fetch.
+    """
+
+    def __init__(self, backend=None, refresh_workers=2):
+        self.backend = backend or MemoryBackend()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="cache-refresh")
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refresh_errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _fetch_once(self, key, fetch, cacheable):
+        """Run `fetch` for `key` unless another caller already is, and share its result"""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            value = fetch()
+            if cacheable is None or cacheable(value):
+                self.backend.set(key, value, time.time())
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _refresh(self, key, fetch, cacheable):
+        with self._lock:
+            if key in self._inflight:
+                return
+
+        def run():
+            try:
+                self._fetch_once(key, fetch, cacheable)
+            except Exception as e:
+                self._count("refresh_errors")
+                print(f"Warning: background refresh of {key} failed: {e}")
+
+        self._refresher.submit(run)
+
+    def get_or_fetch(self, key, fetch, ttl, stale_ttl=0, cacheable=None):
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < ttl:
+                self._count("hits")
+                note_data_time(stored_at)
+                return value
+            if age < ttl + stale_ttl:
+                self._count("stale_hits")
+                self._refresh(key, fetch, cacheable)
+                note_data_time(stored_at)
+                return value
+
+        self._count("misses")
+        value = self._fetch_once(key, fetch, cacheable)
+        note_data_time(time.time())
+        return value
+
+    def cached(self, ttl, stale_ttl=0, cacheable=None):
+        """Decorator caching a function's result per call arguments.
+
+        The wrapper gains a `refresh(*args, **kwargs)` attribute that always
+        fetches and stores a new result, for callers that keep entries warm.
+        """
+        def decorator(func):
+            def make_key(args, kwargs):
+                return f"{func.__name__}:{args!r}:{sorted(kwargs.items())!r}"
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return self.get_or_fetch(
+                    make_key(args, kwargs), lambda: func(*args, **kwargs), ttl, stale_ttl, cacheable
+                )
+
+            def refresh(*args, **kwargs):
+                return self._fetch_once(make_key(args, kwargs), lambda: func(*args, **kwargs), cacheable)
+
+            wrapper.refresh = refresh
+            return wrapper
+        return decorator
+
+    def invalidate(self, key):
+        self.backend.delete(key)
+
+    def status(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["entries"] = len(self.backend)
+        return stats
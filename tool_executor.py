@@ -0,0 +1,69 @@
+"""Runs blocking scraping tools on a bounded worker pool so the MCP event loop stays free"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ToolBusyError(RuntimeError):
+    """Raised when too many tool calls are already waiting for a worker"""
+
+
+class ToolExecutor:
+    """Thread pool with per-tool concurrency limits and a cap on queued calls"""
+
+    def __init__(self, max_workers=4, max_queue=16, default_limit=1):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.default_limit = default_limit
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool-worker")
+        self._semaphores = {}
+        self._limits = {}
+        self._pending = 0
+        self._running = {}
+
+    def _semaphore(self, name):
+        if name not in self._semaphores:
+            self._semaphores[name] = asyncio.Semaphore(self._limits.get(name, self.default_limit))
+        return self._semaphores[name]
+
+    async def run(self, name, func, *args, **kwargs):
+        """Run `func` on the pool, waiting for a slot of tool `name` first"""
+        if self._pending >= self.max_queue:
+            raise ToolBusyError(f"Too many pending tool calls ({self._pending}), try again later")
+        self._pending += 1
+        try:
+            async with self._semaphore(name):
+                self._running[name] = self._running.get(name, 0) + 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    # Carry the caller's context (request ID) into the worker thread
+                    context = contextvars.copy_context()
+                    return await loop.run_in_executor(self._pool, functools.partial(context.run, func, *args, **kwargs))
+                finally:
+                    self._running[name] -= 1
+        finally:
+            self._pending -= 1
+
+    def offload(self, limit=None):
+        """Decorator turning a blocking tool function into an async one run on the pool"""
+        def decorator(func):
+            if limit is not None:
+                self._limits[func.__name__] = limit
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return await self.run(func.__name__, func, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def status(self):
+        return {
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "max_queue": self.max_queue,
+            "running": {name: count for name, count in self._running.items() if count},
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,147 @@
+"""Local SQLite catalogue of scraped tours for precise filter/sort/top-k queries"""
+import json
+import sqlite3
+import threading
+import time
+
+SORT_COLUMNS = {"price", "departure", "nights", "stars"}
+
+CATALOG_FIELDS = ["destination", "hotel", "stars", "nights", "departure", "price", "currency", "url"]
+
+# One offer of a listing. The same hotel and dates come in several offers (e.g. meal plans)
+# that differ only in price and booking link, so the link is part of the identity
+TOUR_IDENTITY_FIELDS = ("hotel", "stars", "nights", "departure", "currency", "url")
+
+
+def tour_identity(record):
+    """Identity of a tour offer within its destination; the price stands in for a missing booking link"""
+    identity = tuple(record.get(field) for field in TOUR_IDENTITY_FIELDS)
+    return identity if record.get("url") else identity + (record.get("price"),)
+
+
+def offer_key(record):
+    return json.dumps(tour_identity(record), ensure_ascii=False)
+
+
+class TourCatalog:
+    """Tour records by destination, indexed on price, departure date and nights.
+
+    `upsert` takes a destination's full current listing: known tours are
+    updated in place (e.g. a new price), new ones inserted, and tours that
+    vanished from the listing removed.
+    """
+
+    def __init__(self, path="tour_catalog.sqlite3"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # Tables from before offer_key merged offers that differ only in price; they are refilled by the next scrape
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tours)")}
+        if columns and "offer_key" not in columns:
+            self._conn.execute("DROP TABLE tours")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tours (
+                destination TEXT NOT NULL,
+                hotel TEXT,
+                stars INTEGER,
+                nights INTEGER,
+                departure TEXT,
+                price INTEGER,
+                currency TEXT,
+                url TEXT,
+                offer_key TEXT NOT NULL,
+                seen_at REAL NOT NULL,
+                UNIQUE (destination, offer_key)
+            );
+            CREATE INDEX IF NOT EXISTS tours_price ON tours (destination, price);
+            CREATE INDEX IF NOT EXISTS tours_departure ON tours (destination, departure);
+            CREATE INDEX IF NOT EXISTS tours_nights ON tours (destination, nights);
+            CREATE INDEX IF NOT EXISTS tours_any_price ON tours (price);
+        """)
+        self._conn.commit()
+
+    def upsert(self, destination, records):
+        seen_at = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO tours (destination, hotel, stars, nights, departure, price, currency, url, offer_key, seen_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (destination, offer_key) "
+                    "DO UPDATE SET price = excluded.price, seen_at = excluded.seen_at",
+                    [
+                        (destination, record["hotel"], record["stars"], record["nights"], record["departure"],
+                         record["price"], record["currency"], record["url"], offer_key(record), seen_at)
+                        for record in records
+                    ],
+                )
+                self._conn.execute(
+                    "DELETE FROM tours WHERE destination = ? AND seen_at < ?", (destination, seen_at)
+                )
+
+    def apply_changes(self, destination, added, removed, price_changed):
+        """Write only a listing's delta: insert added tours, reprice changed ones, drop removed ones"""
+        seen_at = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO tours (destination, hotel, stars, nights, departure, price, currency, url, offer_key, seen_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (destination, record["hotel"], record["stars"], record["nights"], record["departure"],
+                         record["price"], record["currency"], record["url"], offer_key(record), seen_at)
+                        for record in added
+                    ],
+                )
+                self._conn.executemany(
+                    "UPDATE tours SET price = ?, seen_at = ? WHERE destination = ? AND offer_key = ?",
+                    [(record["price"], seen_at, destination, offer_key(record)) for record in price_changed],
+                )
+                self._conn.executemany(
+                    "DELETE FROM tours WHERE destination = ? AND offer_key = ?",
+                    [(destination, offer_key(record)) for record in removed],
+                )
+
+    def count(self, destination):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tours WHERE destination = ?", (destination,)).fetchone()[0]
+
+    def last_seen(self, destination):
+        """When the destination's listing was last written, or None if the catalogue has none"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MAX(seen_at) FROM tours WHERE destination = ?", (destination,)
+            ).fetchone()[0]
+
+    def query(self, destination=None, min_price=None, max_price=None, currency=None,
+              min_nights=None, max_nights=None, departure_from=None, departure_to=None,
+              min_stars=None, sort_by="price", descending=False, limit=10):
+        """Return (matching rows as dicts, total number of matches) for the given filters"""
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"sort_by must be one of {sorted(SORT_COLUMNS)}")
+        conditions = []
+        params = []
+        for clause, value in [
+            ("destination = ?", destination),
+            ("price >= ?", min_price),
+            ("price <= ?", max_price),
+            ("currency = ?", currency),
+            ("nights >= ?", min_nights),
+            ("nights <= ?", max_nights),
+            ("departure >= ?", departure_from),
+            ("departure <= ?", departure_to),
+            ("stars >= ?", min_stars),
+        ]:
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = f"{sort_by} IS NULL, {sort_by} {'DESC' if descending else 'ASC'}"
+        columns = ", ".join(CATALOG_FIELDS)
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM tours {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {columns} FROM tours {where} ORDER BY {order} LIMIT ?", params + [max(limit, 0)]
+            ).fetchall()
+        return [dict(row) for row in rows], total
@@ -0,0 +1,29 @@
+"""Compact, LLM-facing rendering of structured tour records"""
+import json
+
+TOUR_FIELDS = ["hotel", "stars", "nights", "departure", "price", "currency", "url"]
+
+OUTPUT_FORMATS = ("table", "json")
+
+
+def filter_tours(records, max_price=None, limit=None):
+    if max_price is not None:
+        records = [record for record in records if record["price"] is not None and record["price"] <= max_price]
+    if limit is not None:
+        records = records[:max(limit, 0)]
+    return records
+
+
+def render_tours(records, output_format="table", total_count=None, fields=TOUR_FIELDS):
+    """Render records as a pipe table (fewest tokens) or minified JSON without empty fields"""
+    total_count = len(records) if total_count is None else total_count
+    if output_format == "json":
+        tours = [{key: value for key, value in record.items() if value is not None} for record in records]
+        return json.dumps({"tours": tours, "shown": len(tours), "total_count": total_count},
+                          ensure_ascii=False, separators=(",", ":"))
+
+    lines = ["|".join(fields)]
+    for record in records:
+        lines.append("|".join("" if record.get(field) is None else str(record[field]) for field in fields))
+    lines.append(f"shown {len(records)} of {total_count}")
+    return "\n".join(lines)
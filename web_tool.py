@@ -1,81 +1,310 @@
 from langchain_community.document_loaders import WebBaseLoader
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
+import asyncio
+import atexit
+import functools
+import inspect
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from fastmcp import FastMCP
+from fastmcp.server.dependencies import get_http_request
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from langchain_ollama import OllamaEmbeddings
+from pymilvus import MilvusClient
 from dotenv import load_dotenv
 import json
 import bs4
+
+from browser_pool import BrowserPool
+from tool_cache import MemoryBackend, SQLiteBackend, ToolCache, note_data_time, served_data_times, with_data_time
+from tool_executor import ToolExecutor
+from fetch_strategy import PageFetcher
+from prewarm import Prewarmer
+from extraction import TourExtractor
+from destinations import DESTINATIONS, HOT_TOURS_BASE_URL, HOT_TOURS_HOTEL_SELECTOR, HOT_TOURS_PRICE_SELECTOR, HOT_TOURS_ROW_SELECTOR
+from tour_output import OUTPUT_FORMATS, filter_tours, render_tours
+from tour_catalog import CATALOG_FIELDS, TourCatalog
+from rag_index import RagIndex
+from change_detection import ChangeTracker, page_fingerprint
+from metrics import PROMETHEUS_CONTENT_TYPE, REQUEST_ID_HEADER, new_request_id, registry, request_id_var, span
 load_dotenv()
 
 mcp = FastMCP("Employees MCP HTTP Agent")
 
-def load_page_with_scroll(url, wait_time=5, scroll_pause=2):
-    """Load page with waiting and scrolling functionality"""
-    # Setup Chrome options
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # Run in background
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1920,1080")
-    chrome_options.add_argument("--disable-web-security")
-    chrome_options.add_argument("--disable-features=VizDisplayCompositor")
-    chrome_options.add_argument("--log-level=3")  # Suppress most logs
-    chrome_options.add_experimental_option("excludeSwitches", ["enable-logging"])
-    chrome_options.add_experimental_option('useAutomationExtension', False)
-    
-    driver = webdriver.Chrome(options=chrome_options)
-    
+def incoming_request_id():
+    """Request ID sent by app.py with the current MCP call, or a fresh one"""
     try:
-        # Load the page
-        driver.get(url)
-        
-        # Wait for page to load
-        WebDriverWait(driver, wait_time).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
+        return get_http_request().headers.get(REQUEST_ID_HEADER) or new_request_id()
+    except RuntimeError:
+        return new_request_id()
+
+def traced_tool(description, name):
+    """Register an MCP tool that runs under the caller's request ID and is timed per call.
+    A result built from cached data ends with the fetch time of its oldest part"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = request_id_var.set(incoming_request_id())
+            data_times = []
+            data_token = served_data_times.set(data_times)
+            try:
+                with span("mcp_tool", tool=name):
+                    result = func(*args, **kwargs)
+                    if inspect.isawaitable(result):
+                        result = await result
+                    if data_times and isinstance(result, str):
+                        result = with_data_time(result, min(data_times))
+                    return result
+            finally:
+                served_data_times.reset(data_token)
+                request_id_var.reset(token)
+        return mcp.tool(description=description, name=name)(wrapper)
+    return decorator
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> PlainTextResponse:
+    """Prometheus metrics of tool calls and browser work"""
+    return PlainTextResponse(registry.render(), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+# Shared headless Chrome sessions, reused across tool calls
+browser_pool = BrowserPool(
+    size=int(os.environ.get("BROWSER_POOL_SIZE", "2")),
+    max_pages=int(os.environ.get("BROWSER_MAX_PAGES", "50")),
+    checkout_timeout=float(os.environ.get("BROWSER_CHECKOUT_TIMEOUT", "120")),
+)
+atexit.register(browser_pool.close)
+
+# Scraped results cache; set TOOL_CACHE_BACKEND=sqlite to keep it across restarts
+TOOL_CACHE_MAX_ENTRIES = int(os.environ.get("TOOL_CACHE_MAX_ENTRIES", "256"))
+if os.environ.get("TOOL_CACHE_BACKEND", "memory") == "sqlite":
+    _cache_backend = SQLiteBackend(os.environ.get("TOOL_CACHE_PATH", "tool_cache.sqlite3"), TOOL_CACHE_MAX_ENTRIES)
+else:
+    _cache_backend = MemoryBackend(TOOL_CACHE_MAX_ENTRIES)
+tool_cache = ToolCache(_cache_backend)
+
+# Blocking browser work runs here so one slow scrape does not stall other requests
+tool_executor = ToolExecutor(
+    max_workers=int(os.environ.get("TOOL_WORKERS", "4")),
+    max_queue=int(os.environ.get("TOOL_QUEUE_LIMIT", "16")),
+    default_limit=int(os.environ.get("TOOL_CONCURRENCY_PER_TOOL", "1")),
+)
+atexit.register(tool_executor.shutdown)
+
+# Seconds a result is fresh, then how long it may still be served while refreshing
+HOT_TOURS_CACHE_TTL = float(os.environ.get("HOT_TOURS_CACHE_TTL", "300"))
+HOT_TOURS_STALE_TTL = float(os.environ.get("HOT_TOURS_STALE_TTL", "1800"))
+CALENDAR_CACHE_TTL = float(os.environ.get("CALENDAR_CACHE_TTL", "86400"))
+CALENDAR_STALE_TTL = float(os.environ.get("CALENDAR_STALE_TTL", "604800"))
+NEWS_CACHE_TTL = float(os.environ.get("NEWS_CACHE_TTL", "180"))
+NEWS_STALE_TTL = float(os.environ.get("NEWS_STALE_TTL", "900"))
+
+# Background refresh keeps every tool's cache entry fresh before users ask
+PREWARM_ENABLED = os.environ.get("PREWARM_ENABLED", "true").lower() == "true"
+HOT_TOURS_PREWARM_INTERVAL = float(os.environ.get("HOT_TOURS_PREWARM_INTERVAL", "240"))
+NEWS_PREWARM_INTERVAL = float(os.environ.get("NEWS_PREWARM_INTERVAL", "150"))
+CALENDAR_PREWARM_INTERVAL = float(os.environ.get("CALENDAR_PREWARM_INTERVAL", "43200"))
+prewarmer = Prewarmer(jitter=float(os.environ.get("PREWARM_JITTER", "0.1")))
+atexit.register(prewarmer.stop)
+
+HOT_TOURS_ITEM_TIMEOUT = float(os.environ.get("HOT_TOURS_ITEM_TIMEOUT", "60"))
+
+# Every scrape is upserted here so filtered/top-k questions are answered by SQL
+tour_catalog = TourCatalog(os.environ.get("TOUR_CATALOG_PATH", "tour_catalog.sqlite3"))
+
+# Scraped passages are embedded into Milvus for the semantic_search tool
+RAG_ENABLED = os.environ.get("RAG_ENABLED", "true").lower() == "true"
+rag_index = None
+if RAG_ENABLED:
+    try:
+        rag_index = RagIndex(
+            MilvusClient(uri=os.environ.get("MILVUS_URI", "./milvus_rag.db"), token=os.environ.get("MILVUS_TOKEN", "")),
+            OllamaEmbeddings(model=os.environ.get("EMBEDDING_MODEL", "nomic-embed-text:v1.5"), base_url=os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")),
+            collection_name=os.environ.get("RAG_COLLECTION", "travel_content"),
+            batch_size=int(os.environ.get("RAG_BATCH_SIZE", "32")),
         )
-        
-        # Scroll down to load more content
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        
-        while True:
-            # Scroll down
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    except Exception as e:
+        print(f"Warning: Could not initialize RAG index: {e}")
+
+# Embedding runs off the scraping path, one ingestion at a time
+rag_ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-ingest")
+atexit.register(rag_ingest_executor.shutdown, wait=False, cancel_futures=True)
+
+def rag_ingest(source, passages, removed_passages=None):
+    """Queue passages for background ingestion into the RAG index.
+
+    With `removed_passages`, `passages` is only the delta: those are embedded
+    and the removed ones deleted, leaving the rest of the source untouched.
+    """
+    if rag_index is None:
+        return
+    
+    def run():
+        try:
+            if removed_passages is None:
+                embedded = rag_index.ingest(source, passages)
+            else:
+                embedded = rag_index.apply_changes(source, passages, removed_passages)
+            print(f"RAG ingest {source}: {embedded} new chunks of {len(passages)} passages")
+        except Exception as e:
+            print(f"Warning: RAG ingest of {source} failed: {e}")
+    
+    rag_ingest_executor.submit(run)
+
+# Page and item fingerprints; unchanged pages skip parsing, changed listings
+# only push their delta to the catalogue and the RAG index
+change_tracker = ChangeTracker()
+
+def is_cacheable(result):
+    """Error payloads are returned to the caller but never cached"""
+    try:
+        return "error" not in json.loads(result)
+    except (TypeError, ValueError):
+        return False
+
+# Records when the DOM last changed so scrolling can stop as soon as the page settles
+INSTALL_MUTATION_WATCH_JS = """
+if (!window.__scrollWatch) {
+    window.__scrollWatch = {last: performance.now()};
+    performance.setResourceTimingBufferSize(10000);
+    new MutationObserver(function () {
+        window.__scrollWatch.last = performance.now();
+    }).observe(document.documentElement, {childList: true, subtree: true});
+}
+"""
+
+# Returns [ms since last DOM mutation, finished network requests, page height, target count]
+PAGE_PROBE_JS = """
+return [
+    performance.now() - window.__scrollWatch.last,
+    performance.getEntriesByType('resource').length,
+    document.body.scrollHeight,
+    arguments[0] ? document.querySelectorAll(arguments[0]).length : 0
+];
+"""
+
+# Last load timings per URL, including the idle time saved against fixed sleeps
+page_load_stats = {}
+
+def wait_for_page_settle(driver, target_selector, max_wait, quiet_period=0.5, poll_interval=0.1):
+    """Poll until the DOM and network have been quiet for `quiet_period`, or `max_wait` runs out"""
+    started = time.monotonic()
+    last_resources = None
+    resources_stable_since = started
+    while True:
+        quiet_ms, resources, height, count = driver.execute_script(PAGE_PROBE_JS, target_selector)
+        now = time.monotonic()
+        if resources != last_resources:
+            last_resources = resources
+            resources_stable_since = now
+        network_idle = now - resources_stable_since >= quiet_period
+        if (quiet_ms >= quiet_period * 1000 and network_idle) or now - started >= max_wait:
+            return height, count
+        time.sleep(poll_interval)
+
+def load_page_with_scroll(url, wait_time=5, scroll_pause=2, target_selector=None, max_scrolls=20, deadline=60, quiet_period=0.5):
+    """Load page with waiting and scrolling functionality
+
+    Scrolls until the page height (or the number of `target_selector`
+    matches, when given) stops changing between steps. `scroll_pause` is only
+    an upper bound on each step's wait; steps end as soon as the DOM and
+    network go quiet. `max_scrolls` and `deadline` cap the whole call.
+    """
+    started = time.monotonic()
+    deadline_at = started + deadline
+    with browser_pool.page() as driver:
+        with span("page_load", _url=url):
+            # Load the page
+            driver.get(url)
             
-            # Wait for new content to load
-            time.sleep(scroll_pause)
+            # Wait for page to load
+            WebDriverWait(driver, wait_time).until(
+                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            )
+            driver.execute_script(INSTALL_MUTATION_WATCH_JS)
+        loaded = time.monotonic()
+        
+        with span("page_scroll", _url=url) as scroll_span:
+            # Scroll down to load more content
+            last_height, last_count = wait_for_page_settle(driver, target_selector, scroll_pause, quiet_period)
+            scrolls = 0
+            stop_reason = "max_scrolls"
             
-            # Calculate new scroll height
-            new_height = driver.execute_script("return document.body.scrollHeight")
+            while scrolls < max_scrolls:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    stop_reason = "deadline"
+                    break
+                
+                # Scroll down
+                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+                scrolls += 1
+                
+                # Wait for new content to load
+                new_height, new_count = wait_for_page_settle(driver, target_selector, min(scroll_pause, remaining), quiet_period)
             
-            # If height is the same, we've reached the bottom
-            if new_height == last_height:
-                break
+                # Stop once the targets (or the page height) no longer grow
+                if target_selector and new_count:
+                    settled = new_count == last_count
+                else:
+                    settled = new_height == last_height
+                if settled:
+                    stop_reason = "stable"
+                    break
                 
-            last_height = new_height
+                last_height, last_count = new_height, new_count
+            scroll_span["_scrolls"] = scrolls
+            scroll_span["_stop_reason"] = stop_reason
         
         # Get the final page source
         page_source = driver.page_source
-        return page_source
-        
-    finally:
-        driver.quit()
+    
+    finished = time.monotonic()
+    scroll_time = finished - loaded
+    page_load_stats[url] = {
+        "load_seconds": round(loaded - started, 3),
+        "scroll_seconds": round(scroll_time, 3),
+        "scrolls": scrolls,
+        "target_count": last_count,
+        "stop_reason": stop_reason,
+        # The fixed-sleep loop paid scroll_pause after every one of these scrolls
+        "saved_seconds": round(max(scrolls, 1) * scroll_pause - scroll_time, 3),
+    }
+    print(f"Loaded {url}: {page_load_stats[url]}")
+    return page_source
+
+# Static pages are fetched over plain HTTP; the browser is only used when needed
+page_fetcher = PageFetcher(
+    load_page_with_scroll,
+    timeout=float(os.environ.get("HTTP_FETCH_TIMEOUT", "15")),
+    reprobe_after=float(os.environ.get("HTTP_REPROBE_AFTER", "3600")),
+    rewrite_base=os.environ.get("FETCH_REWRITE_BASE") or None,
+)
 
-@mcp.tool(description="Получение списка последних новостей", name="latest_news_details")
+@traced_tool(description="Получение списка последних новостей", name="latest_news_details")
+@tool_executor.offload()
+@prewarmer.keep_warm(NEWS_PREWARM_INTERVAL, name="latest_news_details")
+@tool_cache.cached(NEWS_CACHE_TTL, NEWS_STALE_TTL, cacheable=is_cacheable)
 def get_employee_detail() -> str:
     """Получение списка последних новостей с сайта"""
     url = "https://tengrinews.kz"
     
-    # Load page with waiting and scrolling
-    page_source = load_page_with_scroll(url, wait_time=10, scroll_pause=3)
+    # Fetch over HTTP, or load with waiting and scrolling when the page needs a browser
+    page_source = page_fetcher.fetch(url, wait_time=10, scroll_pause=3, target_selector=".main-news_super_item", max_scrolls=5, deadline=30)
+    
+    # Nothing to re-parse or re-index if the page did not change
+    fingerprint = page_fingerprint(page_source)
+    previous = change_tracker.unchanged_result("latest_news_details", fingerprint)
+    if previous is not None:
+        return previous
     
     # Parse the HTML content
-    soup = bs4.BeautifulSoup(page_source, 'html.parser')
+    with span("page_parse", source="latest_news_details"):
+        soup = bs4.BeautifulSoup(page_source, 'html.parser')
     
     # Extract news items
     news_items = []
@@ -99,6 +328,10 @@ def get_employee_detail() -> str:
                 "urls": url
             })
     
+    rag_ingest("latest_news_details", [
+        f"{item['content']} {item['urls'] or ''}".strip() for item in news_items
+    ])
+    
     # Convert to JSON
     result = {
         "news_items": news_items,
@@ -106,190 +339,220 @@ def get_employee_detail() -> str:
     }
     
     json_string = json.dumps(result, ensure_ascii=False, indent=4)
+    change_tracker.update("latest_news_details", fingerprint, json_string)
     return json_string 
 
-@mcp.tool(description="Получение списка туров во Вьетнам", name="get_hot_tours_vietnam")
-def get_vietnam_tours() -> str:
-    """Получение списка горящих туров с сайта"""
-    url = "https://ht.kz/tours/vietnam-from-almaty"
-    
-    # Load page with waiting and scrolling
-    page_source = load_page_with_scroll(url, wait_time=10, scroll_pause=3)
-    
-    # Parse the HTML content
-    soup = bs4.BeautifulSoup(page_source, 'html.parser')
-    
-    # Extract tour items
-    tour_items = []
-    tour_elements = soup.find_all(class_=["ng-row", "ng-content", "ng-prices","href"])
-    print(tour_elements)
-    
-    for element in tour_elements:
-        # Extract text content
-        text_content = element.get_text(strip=True)
-        
-        # Extract links safely
-        link_element = element.find('a')
-        url = None
-        if link_element:
-            url = link_element.get('href')
-            if url and url.startswith('/'):
-                url = f"https://ht.kz{url}"
-        
-        if text_content:
-            tour_items.append({
-                "content": text_content,
-                "urls": url
-            })
-    
-    # Convert to JSON
-    result = {
-        "tour_items": tour_items,
-        "total_count": len(tour_items)
-    }
-    
-    json_string = json.dumps(result, ensure_ascii=False, indent=4)
-    return json_string 
+# One compiled extraction pipeline shared by every destination
+hot_tours_extractor = TourExtractor(HOT_TOURS_ROW_SELECTOR, HOT_TOURS_HOTEL_SELECTOR, HOT_TOURS_PRICE_SELECTOR, HOT_TOURS_BASE_URL)
 
-@mcp.tool(description="Получение списка туров в Турцию", name="get_hot_tours_tyrkey")
-def get_tyrkey_tours() -> str:
-    """Получение списка горящих туров с сайта"""
-    url = "https://ht.kz/tours/turkey-from-almaty"
-    
-    # Load page with waiting and scrolling
-    page_source = load_page_with_scroll(url, wait_time=10, scroll_pause=3)
-    
-    # Parse the HTML content
-    soup = bs4.BeautifulSoup(page_source, 'html.parser')
-    
-    # Extract tour items
-    tour_items = []
-    tour_elements = soup.find_all(class_=["ng-row", "ng-content", "ng-prices","href"])
-    print(tour_elements)
-    
-    for element in tour_elements:
-        # Extract text content
-        text_content = element.get_text(strip=True)
-        
-        # Extract links safely
-        link_element = element.find('a')
-        url = None
-        if link_element:
-            url = link_element.get('href')
-            if url and url.startswith('/'):
-                url = f"https://ht.kz{url}"
-        
-        if text_content:
-            tour_items.append({
-                "content": text_content,
-                "urls": url
-            })
-    
-    # Convert to JSON
-    result = {
-        "tour_items": tour_items,
-        "total_count": len(tour_items)
-    }
-    
-    json_string = json.dumps(result, ensure_ascii=False, indent=4)
-    return json_string 
+# Cached hot-tour scrapers by destination, for the combined get_hot_tours tool
+HOT_TOUR_SCRAPERS = {}
+
+# A listing with far fewer tours than the catalogue holds is more likely a captcha, error or
+# half-rendered page than a real change; it is accepted only once it repeats this many times
+HOT_TOURS_MIN_KEPT_SHARE = float(os.environ.get("HOT_TOURS_MIN_KEPT_SHARE", "0.5"))
+HOT_TOURS_SHRINK_CONFIRMATIONS = int(os.environ.get("HOT_TOURS_SHRINK_CONFIRMATIONS", "3"))
+shrunk_listings = {}
+
+def check_listing(slug, tour_items):
+    """Raise for a listing that looks like a failed page load, so the cached result and catalogue stay as they are"""
+    if not tour_items:
+        raise RuntimeError(f"На странице туров {slug} не найдено ни одного тура: вероятно, капча или ошибка загрузки")
+    known = tour_catalog.count(slug)
+    if len(tour_items) >= known * HOT_TOURS_MIN_KEPT_SHARE:
+        shrunk_listings.pop(slug, None)
+        return
+    strikes = shrunk_listings[slug] = shrunk_listings.get(slug, 0) + 1
+    if strikes < HOT_TOURS_SHRINK_CONFIRMATIONS:
+        raise RuntimeError(f"На странице туров {slug} {len(tour_items)} туров вместо {known}: вероятно, страница загрузилась не полностью")
+    shrunk_listings.pop(slug, None)
 
-@mcp.tool(description="Получение списка туров в Тайланд", name="get_hot_tours_thailand")
-def get_hailand_tours() -> str:
+def scrape_hot_tours(slug, url):
     """Получение списка горящих туров с сайта"""
-    url = "https://ht.kz/tours/thailand-from-almaty"
+    # Fetch over HTTP, or load with waiting and scrolling when the page needs a browser
+    page_source = page_fetcher.fetch(url, wait_time=10, scroll_pause=3, target_selector=HOT_TOURS_ROW_SELECTOR, max_scrolls=15, deadline=45)
     
-    # Load page with waiting and scrolling
-    page_source = load_page_with_scroll(url, wait_time=10, scroll_pause=3)
+    tool_name = DESTINATIONS[slug]["tool_name"]
+    fingerprint = page_fingerprint(page_source)
+    previous = change_tracker.unchanged_result(tool_name, fingerprint)
+    if previous is not None:
+        return previous
     
-    # Parse the HTML content
-    soup = bs4.BeautifulSoup(page_source, 'html.parser')
-    
-    # Extract tour items
-    tour_items = []
-    tour_elements = soup.find_all(class_=["ng-row", "ng-content", "ng-prices","href"])
-    print(tour_elements)
-    
-    for element in tour_elements:
-        # Extract text content
-        text_content = element.get_text(strip=True)
-        
-        # Extract links safely
-        link_element = element.find('a')
-        url = None
-        if link_element:
-            url = link_element.get('href')
-            if url and url.startswith('/'):
-                url = f"https://ht.kz{url}"
-        
-        if text_content:
-            tour_items.append({
-                "content": text_content,
-                "urls": url
-            })
+    with span("page_parse", source=tool_name):
+        tour_items = hot_tours_extractor.extract(page_source)
+    check_listing(slug, tour_items)
     
-    # Convert to JSON
+    # Every record is cached; filtering and formatting happen per call
     result = {
         "tour_items": tour_items,
         "total_count": len(tour_items)
     }
     
-    json_string = json.dumps(result, ensure_ascii=False, indent=4)
+    json_string = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+    delta = change_tracker.update(tool_name, fingerprint, json_string, tour_items)
+    
+    if delta is None:
+        # First listing since startup: sync everything
+        tour_catalog.upsert(slug, tour_items)
+        rag_ingest(tool_name, [tour_passage(slug, record) for record in tour_items])
+    elif delta["added"] or delta["removed"] or delta["price_changed"]:
+        tour_catalog.apply_changes(slug, delta["added"], delta["removed"], delta["price_changed"])
+        previously = [{**record, "price": record["old_price"]} for record in delta["price_changed"]]
+        rag_ingest(
+            tool_name,
+            [tour_passage(slug, record) for record in delta["added"] + delta["price_changed"]],
+            removed_passages=[tour_passage(slug, record) for record in delta["removed"] + previously],
+        )
     return json_string 
 
-@mcp.tool(description="Получение списка туров на Мальдивы", name="get_hot_tours_maldives")
-def get_maldives_tours() -> str:
-    """Получение списка горящих туров с сайта"""
-    url = "https://ht.kz/tours/maldives-from-almaty"
-    
-    # Load page with waiting and scrolling
-    page_source = load_page_with_scroll(url, wait_time=10, scroll_pause=3)
-    
-    # Parse the HTML content
-    soup = bs4.BeautifulSoup(page_source, 'html.parser')
-    
-    # Extract tour items
-    tour_items = []
-    tour_elements = soup.find_all(class_=["ng-row", "ng-content", "ng-prices","href"])
-    print(tour_elements)
-    
-    for element in tour_elements:
-        # Extract text content
-        text_content = element.get_text(strip=True)
-        
-        # Extract links safely
-        link_element = element.find('a')
-        url = None
-        if link_element:
-            url = link_element.get('href')
-            if url and url.startswith('/'):
-                url = f"https://ht.kz{url}"
-        
-        if text_content:
-            tour_items.append({
-                "content": text_content,
-                "urls": url
-            })
-    
-    # Convert to JSON
-    result = {
-        "tour_items": tour_items,
-        "total_count": len(tour_items)
-    }
+def tour_passage(slug, record):
+    """Text of one tour as indexed for semantic search"""
+    return f"Тур {DESTINATIONS[slug]['title']}: " + ", ".join(
+        f"{key}: {value}" for key, value in record.items() if value is not None and key != "old_price"
+    )
+
+def render_hot_tours(scraped, limit=None, max_price=None, output_format="table"):
+    """Filter cached tour records and render them compactly for the model"""
+    records = json.loads(scraped)["tour_items"]
+    if output_format not in OUTPUT_FORMATS:
+        output_format = "table"
+    return render_tours(filter_tours(records, max_price, limit), output_format, total_count=len(records))
+
+def register_hot_tours_tool(slug, destination):
+    """Create the cached, prewarmed MCP tool for one registry destination"""
+    tool_name = destination["tool_name"]
+    
+    def scrape() -> str:
+        return scrape_hot_tours(slug, destination["url"])
+    scrape.__name__ = tool_name
+    scrape.__doc__ = scrape_hot_tours.__doc__
+    
+    scraper = tool_cache.cached(HOT_TOURS_CACHE_TTL, HOT_TOURS_STALE_TTL, cacheable=is_cacheable)(scrape)
+    prewarmer.keep_warm(HOT_TOURS_PREWARM_INTERVAL, name=tool_name)(scraper)
+    HOT_TOUR_SCRAPERS[slug] = scraper
+    
+    async def hot_tours_tool(limit: int | None = None, max_price: int | None = None, output_format: str = "table") -> str:
+        scraped = await tool_executor.run(tool_name, scraper)
+        return render_hot_tours(scraped, limit, max_price, output_format)
+    hot_tours_tool.__name__ = tool_name
+    hot_tours_tool.__doc__ = scrape_hot_tours.__doc__
+    
+    traced_tool(description=f"Получение списка туров {destination['title']}: отель, звёзды, ночи, вылет, цена. max_price и limit сужают выдачу, output_format: table или json", name=tool_name)(hot_tours_tool)
+
+for slug, destination in DESTINATIONS.items():
+    register_hot_tours_tool(slug, destination)
+
+@traced_tool(description=f"Получение списка горящих туров сразу в несколько стран: {', '.join(DESTINATIONS)}. max_price и limit применяются к каждой стране", name="get_hot_tours")
+async def get_hot_tours(destinations: list[str], limit: int | None = None, max_price: int | None = None, output_format: str = "table") -> str:
+    """Горящие туры по нескольким направлениям, загружаемые параллельно"""
+    async def fetch(slug):
+        scraper = HOT_TOUR_SCRAPERS.get(slug)
+        if scraper is None:
+            raise ValueError(f"Неизвестное направление: {slug}")
+        scraped = await asyncio.wait_for(tool_executor.run(scraper.__name__, scraper), HOT_TOURS_ITEM_TIMEOUT)
+        return render_hot_tours(scraped, limit, max_price, output_format)
+    
+    slugs = list(dict.fromkeys(slug.strip().lower() for slug in destinations))
+    outcomes = await asyncio.gather(*(fetch(slug) for slug in slugs), return_exceptions=True)
+    
+    # Report every destination that worked, and why the others did not
+    rendered = {}
+    failed = {}
+    for slug, outcome in zip(slugs, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            failed[slug] = f"timeout after {HOT_TOURS_ITEM_TIMEOUT:.0f}s"
+        elif isinstance(outcome, BaseException):
+            failed[slug] = str(outcome)
+        else:
+            rendered[slug] = outcome
+    
+    if output_format == "json":
+        result = {"destinations": {slug: json.loads(text) for slug, text in rendered.items()}, "failed": failed}
+        return json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+    sections = [f"## {slug}\n{text}" for slug, text in rendered.items()]
+    sections += [f"## {slug}\nошибка: {reason}" for slug, reason in failed.items()]
+    return "\n\n".join(sections)
+
+async def refresh_catalog(slug):
+    """Write the destination's (cached) scrape into the catalogue"""
+    scraper = HOT_TOUR_SCRAPERS[slug]
+    scraped = await asyncio.wait_for(tool_executor.run(scraper.__name__, scraper), HOT_TOURS_ITEM_TIMEOUT)
+    tour_catalog.upsert(slug, json.loads(scraped)["tour_items"])
+
+@traced_tool(description=f"Точный поиск по каталогу горящих туров ({', '.join(DESTINATIONS)}) с фильтрами по цене, ночам, дате вылета (YYYY-MM-DD) и звёздам; sort_by: price, departure, nights, stars", name="search_tour_catalog")
+async def search_tour_catalog(
+    destination: str | None = None,
+    max_price: int | None = None,
+    min_price: int | None = None,
+    currency: str | None = None,
+    min_nights: int | None = None,
+    max_nights: int | None = None,
+    departure_from: str | None = None,
+    departure_to: str | None = None,
+    min_stars: int | None = None,
+    sort_by: str = "price",
+    descending: bool = False,
+    limit: int = 10,
+    output_format: str = "table",
+) -> str:
+    """Отбор и сортировка туров из локального каталога"""
+    if destination is not None:
+        destination = destination.strip().lower()
+        if destination not in DESTINATIONS:
+            return json.dumps({"error": f"Неизвестное направление: {destination}"}, ensure_ascii=False)
+    
+    # Refill destinations the catalogue has no listing for, or only one older than the scrape cache keeps
+    max_age = HOT_TOURS_CACHE_TTL + HOT_TOURS_STALE_TTL
+    stale = [
+        slug for slug in ([destination] if destination else DESTINATIONS)
+        if (tour_catalog.last_seen(slug) or 0) < time.time() - max_age
+    ]
+    outcomes = await asyncio.gather(*(refresh_catalog(slug) for slug in stale), return_exceptions=True)
+    failed = {slug: str(outcome) or type(outcome).__name__ for slug, outcome in zip(stale, outcomes) if isinstance(outcome, BaseException)}
+    written = [tour_catalog.last_seen(slug) for slug in ([destination] if destination else DESTINATIONS)]
+    if any(written):
+        note_data_time(min(seen for seen in written if seen))
     
-    json_string = json.dumps(result, ensure_ascii=False, indent=4)
-    return json_string 
+    try:
+        rows, total = tour_catalog.query(
+            destination=destination, min_price=min_price, max_price=max_price,
+            currency=currency.upper() if currency else None,
+            min_nights=min_nights, max_nights=max_nights,
+            departure_from=departure_from, departure_to=departure_to,
+            min_stars=min_stars, sort_by=sort_by, descending=descending, limit=limit,
+        )
+    except ValueError as e:
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+    if output_format not in OUTPUT_FORMATS:
+        output_format = "table"
+    rendered = render_tours(rows, output_format, total_count=total, fields=CATALOG_FIELDS)
+    if not failed:
+        return rendered
+    # Rows of a destination that could not be refreshed are still shown, flagged as possibly outdated
+    if output_format == "json":
+        return json.dumps({**json.loads(rendered), "failed": failed}, ensure_ascii=False, separators=(",", ":"))
+    return rendered + "".join(f"\nне удалось обновить {slug}, данные могут быть устаревшими: {reason}" for slug, reason in failed.items())
 
-@mcp.tool(description="Туристический календарь путешествий", name="get_tour_calendar")
+@traced_tool(description="Туристический календарь путешествий", name="get_tour_calendar")
+@tool_executor.offload()
+@prewarmer.keep_warm(CALENDAR_PREWARM_INTERVAL, name="get_tour_calendar")
+@tool_cache.cached(CALENDAR_CACHE_TTL, CALENDAR_STALE_TTL, cacheable=is_cacheable)
 def get_tour_calendar() -> str:
     """Получение туристического календаря с сайта"""
     url = "https://okeanturov.ru/advices/travel-calendar/"
     
-    # Load page with waiting and scrolling
-    page_source = load_page_with_scroll(url, wait_time=10, scroll_pause=3)
+    # Fetch over HTTP, or load with waiting and scrolling when the page needs a browser
+    page_source = page_fetcher.fetch(url, wait_time=10, scroll_pause=3, target_selector="#content h3", max_scrolls=3, deadline=20)
+    
+    # Nothing to re-parse or re-index if the page did not change
+    fingerprint = page_fingerprint(page_source)
+    previous = change_tracker.unchanged_result("get_tour_calendar", fingerprint)
+    if previous is not None:
+        return previous
     
     # Parse the HTML content
-    soup = bs4.BeautifulSoup(page_source, 'html.parser')
+    with span("page_parse", source="get_tour_calendar"):
+        soup = bs4.BeautifulSoup(page_source, 'html.parser')
     
     # Find the content div
     content_div = soup.find('div', id='content')
@@ -367,24 +630,38 @@ def get_tour_calendar() -> str:
             "links": []
         })
     
+    rag_ingest("get_tour_calendar", calendar_info["description"] + [
+        f"{month['month']}: {month['description']}" for month in calendar_info["monthly_recommendations"]
+    ])
+    
     json_string = json.dumps(calendar_info, ensure_ascii=False, indent=4)
+    change_tracker.update("get_tour_calendar", fingerprint, json_string)
     return json_string 
 
-@mcp.tool(description="Куда поехать в разные сезоны", name="get_travel_season")
+@traced_tool(description="Куда поехать в разные сезоны", name="get_travel_season")
+@tool_executor.offload()
+@prewarmer.keep_warm(CALENDAR_PREWARM_INTERVAL, name="get_travel_season")
+@tool_cache.cached(CALENDAR_CACHE_TTL, CALENDAR_STALE_TTL, cacheable=is_cacheable)
 def get_travel_season():
     """Куда поехать в разные сезоны"""
     url = "https://www.travelv.ru/statya.php?id=56"
     
-    # Load page with waiting and scrolling
-    page_source = load_page_with_scroll(url, wait_time=10, scroll_pause=3)
+    # Fetch over HTTP, or load with waiting and scrolling when the page needs a browser
+    page_source = page_fetcher.fetch(url, wait_time=10, scroll_pause=3, target_selector=".text_big", max_scrolls=3, deadline=20)
+    
+    # Nothing to re-parse or re-index if the page did not change
+    fingerprint = page_fingerprint(page_source)
+    previous = change_tracker.unchanged_result("get_travel_season", fingerprint)
+    if previous is not None:
+        return previous
     
     # Parse the HTML content
-    soup = bs4.BeautifulSoup(page_source, 'html.parser')
+    with span("page_parse", source="get_travel_season"):
+        soup = bs4.BeautifulSoup(page_source, 'html.parser')
     
     # Extract tour items
     tour_items = []
     tour_elements = soup.find_all(class_=["text_big mt-5 mb-5"])
-    print(tour_elements)
     
     for element in tour_elements:
         # Extract text content
@@ -404,6 +681,8 @@ def get_travel_season():
                 "urls": url
             })
     
+    rag_ingest("get_travel_season", [item["content"] for item in tour_items])
+    
     # Convert to JSON
     result = {
         "tour_items": tour_items,
@@ -411,8 +690,53 @@ def get_travel_season():
     }
     
     json_string = json.dumps(result, ensure_ascii=False, indent=4)
+    change_tracker.update("get_travel_season", fingerprint, json_string)
     return json_string 
 
 
+# Tools whose output is indexed by rag_ingest; the only valid `source` values of semantic_search
+RAG_SOURCES = ["latest_news_details", "get_tour_calendar", "get_travel_season"] + [destination["tool_name"] for destination in DESTINATIONS.values()]
+
+@traced_tool(description="Семантический поиск по сохранённым турам, новостям, туристическому календарю и сезонам без загрузки сайтов. source — имя инструмента-источника, например get_tour_calendar", name="semantic_search")
+async def semantic_search(query: str, top_k: int = 5, source: str | None = None) -> str:
+    """Top-k фрагментов из векторной базы Milvus"""
+    if rag_index is None:
+        return json.dumps({"error": "Векторный поиск недоступен"}, ensure_ascii=False)
+    source = source.strip() if source else None
+    if source is not None and source not in RAG_SOURCES:
+        return json.dumps({"error": f"Неизвестный источник: {source}", "sources": RAG_SOURCES}, ensure_ascii=False)
+    passages = await tool_executor.run("semantic_search", rag_index.search, query, max(1, min(top_k, 20)), source)
+    return "\n".join(f"[{passage['source']} {passage['score']}] {passage['text']}" for passage in passages) or "Ничего не найдено"
+
+@traced_tool(description=f"Изменения горящих туров с прошлого обновления: новые, исчезнувшие и подешевевшие/подорожавшие туры ({', '.join(DESTINATIONS)})", name="get_tour_changes")
+def get_tour_changes(destination: str) -> str:
+    """Добавленные, удалённые и изменившиеся в цене туры"""
+    slug = destination.strip().lower()
+    if slug not in DESTINATIONS:
+        return json.dumps({"error": f"Неизвестное направление: {destination}"}, ensure_ascii=False)
+    changes = change_tracker.changes(DESTINATIONS[slug]["tool_name"])
+    if changes is None:
+        return json.dumps({"destination": slug, "changes": None, "note": "Изменений пока не зафиксировано"}, ensure_ascii=False)
+    return json.dumps({"destination": slug, **changes}, ensure_ascii=False, separators=(",", ":"))
+
+@traced_tool(description="Состояние данных: возраст снимков, время последнего обновления, кэш и браузеры", name="get_data_status")
+def get_data_status() -> str:
+    """Возраст и время обновления данных каждого инструмента"""
+    status = {
+        "snapshots": prewarmer.status(),
+        "cache": tool_cache.status(),
+        "browser_pool": browser_pool.status(),
+        "workers": tool_executor.status(),
+        "fetch_strategies": page_fetcher.strategies(),
+        "rag_index": rag_index.stats if rag_index else None,
+        "change_detection": change_tracker.stats,
+    }
+    return json.dumps(status, ensure_ascii=False, indent=4)
+
+
 if __name__ == "__main__":
+    # Start the browsers before the first tool call needs them
+    browser_pool.warm(int(os.environ.get("BROWSER_POOL_WARM", "1")))
+    if PREWARM_ENABLED:
+        prewarmer.start()
     mcp.run(transport="streamable-http", host="127.0.0.1", port=9010) 
\ No newline at end of file